@@ -0,0 +1,137 @@
+"""Keeping one IngredientAmount per ingredient and amount text
+
+Amounts are stored normalized (see quantities.normalize_amount) with a
+unique index on (ingredient, amount), and dishes share them. New ones
+are written with INSERT ... ON CONFLICT DO NOTHING, so two requests
+adding the same amount at once both end up with the one row.
+
+Amounts saved twice before the index existed are merged by
+compact_ingredient_amounts, which the migration adding the index runs
+and the compact_ingredient_amounts command can run again."""
+from django.db import connection
+
+from themenu.models import Ingredient, IngredientAmount
+from themenu.quantities import normalize_amount
+
+INSERT_AMOUNTS_SQL = """
+INSERT INTO themenu_ingredientamount (ingredient_id, amount, quantity, unit, descriptor)
+VALUES {values}
+ON CONFLICT (ingredient_id, amount) DO NOTHING
+RETURNING id, ingredient_id, amount
+"""
+
+# Run in order, in one transaction. amount_merges maps each duplicate to
+# the oldest amount with the same normalized ingredient and text.
+COMPACT_AMOUNTS_SQL = [
+    """
+    CREATE TEMPORARY TABLE amount_merges AS
+    SELECT id, keep_id FROM (
+        SELECT id, MIN(id) OVER (PARTITION BY ingredient_id, lower(
+            regexp_replace(regexp_replace(amount, '^\\s+|\\s+$', '', 'g'), '\\s+', ' ', 'g')
+        )) AS keep_id
+        FROM themenu_ingredientamount) AS amounts
+    WHERE id <> keep_id
+    """,
+    """
+    INSERT INTO themenu_dish_ingredient_amounts (dish_id, ingredientamount_id)
+    SELECT DISTINCT dish_amounts.dish_id, amount_merges.keep_id
+    FROM themenu_dish_ingredient_amounts AS dish_amounts
+    JOIN amount_merges ON amount_merges.id = dish_amounts.ingredientamount_id
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    DELETE FROM themenu_dish_ingredient_amounts USING amount_merges
+    WHERE themenu_dish_ingredient_amounts.ingredientamount_id = amount_merges.id
+    """,
+    """
+    UPDATE themenu_grocerylistitem SET ingredient_amount_id = amount_merges.keep_id
+    FROM amount_merges
+    WHERE themenu_grocerylistitem.ingredient_amount_id = amount_merges.id
+    """,
+    # A course that had groceries for two of the duplicates now has two for
+    # the kept amount. Like sync_course_groceries, keep one, along with any
+    # that were bought.
+    """
+    DELETE FROM themenu_grocerylistitem AS extra USING themenu_grocerylistitem AS kept
+    WHERE NOT extra.purchased
+      AND extra.ingredient_amount_id IN (SELECT keep_id FROM amount_merges)
+      AND kept.course_id = extra.course_id
+      AND kept.ingredient_amount_id = extra.ingredient_amount_id
+      AND (kept.purchased OR kept.id < extra.id)
+    """,
+    """
+    DELETE FROM themenu_ingredientamount USING amount_merges
+    WHERE themenu_ingredientamount.id = amount_merges.id
+    """,
+    """
+    UPDATE themenu_ingredientamount SET amount = lower(
+        regexp_replace(regexp_replace(amount, '^\\s+|\\s+$', '', 'g'), '\\s+', ' ', 'g'))
+    WHERE amount <> lower(
+        regexp_replace(regexp_replace(amount, '^\\s+|\\s+$', '', 'g'), '\\s+', ' ', 'g'))
+    """,
+]
+
+
+def intern_amounts(pairs):
+    """The IngredientAmount ids for (ingredient id, amount text) pairs, in
+    the same order, making the ones that don't exist yet
+
+    The ingredients are looked up with one in_bulk and pairs naming one
+    that doesn't exist are dropped. The pairs that are already amounts
+    are found with one query and the rest are made with one upsert. Any
+    made by someone else in between are read back with one more."""
+    ingredients = Ingredient.objects.in_bulk(set(ingredient_id for ingredient_id, _ in pairs))
+    pairs = [(ingredient_id, normalize_amount(amount)) for ingredient_id, amount in pairs
+             if ingredient_id in ingredients]
+    if not pairs:
+        return []
+
+    amount_ids = find_amounts(pairs)
+    missing = []
+    for ingredient_id, amount in pairs:
+        if (ingredient_id, amount) not in amount_ids:
+            new_amount = IngredientAmount(ingredient_id=ingredient_id, amount=amount)
+            new_amount.parse_amount()
+            amount_ids[(ingredient_id, amount)] = None
+            missing.append(new_amount)
+
+    if missing:
+        sql = INSERT_AMOUNTS_SQL.format(values=', '.join(['(%s, %s, %s, %s, %s)'] * len(missing)))
+        params = [value for new_amount in missing
+                  for value in (new_amount.ingredient_id, new_amount.amount, new_amount.quantity,
+                                new_amount.unit, new_amount.descriptor)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for amount_id, ingredient_id, amount in cursor.fetchall():
+                amount_ids[(ingredient_id, amount)] = amount_id
+        raced = [pair for pair, amount_id in amount_ids.items() if amount_id is None]
+        if raced:
+            amount_ids.update(find_amounts(raced))
+
+    return [amount_ids[pair] for pair in pairs]
+
+
+def find_amounts(pairs):
+    """{(ingredient id, amount): id} for the pairs that are already saved"""
+    existing = IngredientAmount.objects.filter(ingredient_id__in=set(i for i, _ in pairs),
+                                               amount__in=set(a for _, a in pairs))\
+                                       .values_list('id', 'ingredient_id', 'amount')
+    wanted = set(pairs)
+    return {(ingredient_id, amount): amount_id
+            for amount_id, ingredient_id, amount in existing
+            if (ingredient_id, amount) in wanted}
+
+
+def compact_ingredient_amounts(cursor):
+    """Merge amounts that are the same once normalized into the oldest of
+    them, moving their dishes and groceries over, then normalize the rest
+
+    Takes a cursor, and only uses SQL, so migrations can run it too.
+    Should be run in a transaction. Returns the number of amounts merged."""
+    cursor.execute(COMPACT_AMOUNTS_SQL[0])
+    cursor.execute('SELECT COUNT(*) FROM amount_merges')
+    merged = cursor.fetchone()[0]
+    for sql in COMPACT_AMOUNTS_SQL[1:]:
+        cursor.execute(sql)
+    cursor.execute('DROP TABLE amount_merges')
+    return merged
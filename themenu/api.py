@@ -0,0 +1,166 @@
+"""Reading any themenu model as json, a page at a time
+
+Pages are cut with a keyset cursor rather than an offset: the client
+passes the id of the last row it got as `after`, and the next page starts
+right past that row in the requested order. Each page is then an index
+range scan, however deep into the table it is.
+
+Rows that belong to a team are only shown to that team."""
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import Q
+
+from themenu.models import (
+    Course, GroceryListItem, Meal, MyUser, RandomGroceryItem, Team, TeamDishStats, TeamStats,
+)
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Model -> the lookup from its rows to their team's id
+TEAM_SCOPES = {
+    Team: 'id',
+    MyUser: 'team',
+    Meal: 'team',
+    Course: 'meal__team',
+    GroceryListItem: 'team',
+    RandomGroceryItem: 'team',
+    TeamStats: 'team',
+    TeamDishStats: 'team',
+}
+
+# Models whose rows are one team's own. Any other model pointing at one of
+# them (an m2m table of meals, say) is the team's too, and isn't served
+# unless it's given a scope above.
+TEAM_OWNED = (Team, Meal, Course)
+
+
+def api_fields(model):
+    """The names a model's rows have in the api
+
+    Like views.get_fields, minus the search vector, which is only of use
+    to the database."""
+    fields = []
+    for field in model._meta.concrete_fields:
+        if isinstance(field, SearchVectorField):
+            continue
+        fields.append(field.name)
+        if field.attname != field.name:
+            fields.append(field.attname)
+    return fields
+
+
+def order_fields(model):
+    """The fields the api can sort by, as name -> column to sort on
+
+    Only columns that can't be null can be paged through with a cursor."""
+    columns = {}
+    for field in model._meta.concrete_fields:
+        if not field.null and not isinstance(field, SearchVectorField):
+            columns[field.name] = columns[field.attname] = field.attname
+    return columns
+
+
+def parse_fields(model, fields=None):
+    """The comma separated field names asked for, or all of them"""
+    available = api_fields(model)
+    if not fields:
+        return available
+    fields = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ValueError('Unknown fields: %s' % ', '.join(unknown))
+    return fields
+
+
+def parse_limit(limit=None):
+    if not limit:
+        return API_PAGE_SIZE
+    limit = int(limit)
+    if not 0 < limit <= API_MAX_PAGE_SIZE:
+        raise ValueError('limit must be between 1 and %d' % API_MAX_PAGE_SIZE)
+    return limit
+
+
+def belongs_to_team(model):
+    """Whether a model's rows point at a team's own rows"""
+    return any(field.is_relation and field.related_model in TEAM_OWNED
+               for field in model._meta.concrete_fields)
+
+
+def cursor_field(model):
+    """The column pages are cut on, which is the id unless the primary
+    key is another field"""
+    return model._meta.pk.attname
+
+
+def scoped_queryset(model, team):
+    """All of a model's rows the team may see
+
+    Raises ValueError for a team's rows when there is no team, and for
+    a model that belongs to teams but has no scope to filter it by."""
+    lookup = TEAM_SCOPES.get(model)
+    if lookup is None:
+        if belongs_to_team(model):
+            raise ValueError('%s rows are not served' % model.__name__)
+        return model.objects.all()
+    if team is None:
+        raise ValueError('No team')
+    return model.objects.filter(**{lookup: team.id})
+
+
+def api_queryset(model, team, fields=None, order_by=None, after=None):
+    """The rows to serve as a values queryset, in order, starting just
+    after the row with id `after` (or whatever the primary key is)
+
+    fields and order_by are as given in the query string, and order_by
+    may start with '-' to sort descending. Rows with the same sort value
+    are ordered by id, so the cursor never skips or repeats one.
+    Raises ValueError for anything that can't be served."""
+    fields = parse_fields(model, fields)
+    queryset = scoped_queryset(model, team)
+    key = cursor_field(model)
+
+    order_by = order_by or key
+    descending = order_by.startswith('-')
+    name = order_by.lstrip('-')
+    columns = order_fields(model)
+    if name not in columns:
+        raise ValueError('Can only order by one of: %s' % ', '.join(sorted(columns)))
+    column = columns[name]
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(prefix + column, prefix + key)
+
+    if after:
+        try:
+            last = queryset.values_list(column, flat=True).get(**{key: int(after)})
+        except model.DoesNotExist:
+            raise ValueError('No row %s to continue after' % after)
+        past = 'lt' if descending else 'gt'
+        queryset = queryset.filter(Q(**{column + '__' + past: last}) |
+                                   Q(**{column: last, key + '__' + past: int(after)}))
+
+    # The id is always fetched so the next cursor can be made from the rows
+    return queryset.values(key, *[f for f in fields if f != key]), fields
+
+
+def iter_api_rows(model, team, fields=None, order_by=None, after=None, limit=None,
+                  chunk_size=API_MAX_PAGE_SIZE):
+    """Every row api_queryset would give, up to limit if there is one,
+    read from the database chunk_size rows at a time
+
+    Django doesn't use server side cursors here, so .iterator() on its own
+    still has psycopg2 hold the whole result in memory. Following the
+    cursor a chunk at a time keeps that to one chunk."""
+    key = cursor_field(model)
+    sent = 0
+    while limit is None or sent < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - sent)
+        rows, _ = api_queryset(model, team, fields, order_by, after)
+        count = 0
+        for row in rows[:size].iterator():
+            count += 1
+            after = row[key]
+            yield row
+        sent += count
+        if count < size:
+            return
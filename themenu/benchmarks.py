@@ -0,0 +1,132 @@
+"""Timing the main pages as one of a team's members sees them
+
+Each page is fetched through the test client, so the whole stack from the
+middleware to the template is measured, with the queries each request
+runs counted alongside. The results are plain dicts, meant to be written
+out as json by the benchmark command and compared across commits.
+
+Nothing sends If-None-Match or If-Modified-Since, so the conditional
+views always build their page. The cache is left warm between requests
+unless asked otherwise, as it would be on the site."""
+import subprocess
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from themenu.models import Course, Dish, GroceryListItem, Meal, Team
+
+
+def compact_date(day):
+    return day.strftime('%Y%m%d')
+
+
+def benchmark_urls(team):
+    """{name: url} of the pages to time for this team"""
+    today = date.today()
+    four_weeks = today + timedelta(weeks=4, days=-1)
+    return OrderedDict([
+        ('calendar', reverse('calendar', args=[compact_date(today)])),
+        ('calendar 4 weeks', reverse('calendar', args=[compact_date(today)]) + '?weeks=4'),
+        ('calendar json', reverse('calendar-json',
+                                  args=[compact_date(today), compact_date(four_weeks)])),
+        ('grocery list', reverse('grocery-list')),
+        ('team detail', reverse('team-detail', args=[team.id])),
+        ('team detail 30 days', reverse('team-detail', args=[team.id]) + '?days=30'),
+        ('scores', reverse('scores')),
+        ('api meals', reverse('model-json', args=['meal']) + '?limit=100'),
+        ('api dishes', reverse('model-json', args=['dish']) + '?limit=100'),
+    ])
+
+
+def percentile(values, percent):
+    """The nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    rank = max(1, int(round(percent / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(timings, query_counts):
+    """Latency percentiles in milliseconds and the queries per request"""
+    return OrderedDict([
+        ('requests', len(timings)),
+        ('p50_ms', round(percentile(timings, 50) * 1000, 2)),
+        ('p90_ms', round(percentile(timings, 90) * 1000, 2)),
+        ('p99_ms', round(percentile(timings, 99) * 1000, 2)),
+        ('mean_ms', round(sum(timings) / len(timings) * 1000, 2)),
+        ('min_ms', round(min(timings) * 1000, 2)),
+        ('max_ms', round(max(timings) * 1000, 2)),
+        ('queries_min', min(query_counts)),
+        ('queries_max', max(query_counts)),
+    ])
+
+
+def fetch(client, url):
+    """GET url, reading the whole response. Returns (seconds, queries)"""
+    with CaptureQueriesContext(connection) as queries:
+        started = time.time()
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.time() - started
+    if response.status_code != 200:
+        raise ValueError('%s answered %d' % (url, response.status_code))
+    return elapsed, len(queries)
+
+
+def run_benchmarks(user, team, names=None, repeat=20, warmup=2, cold=False):
+    """Fetch each page warmup times untimed, then repeat times timed,
+    clearing the cache before each timed request if cold
+
+    Returns {name: summary} in the order of benchmark_urls. Raises
+    ValueError if a page doesn't answer 200 or a name isn't known."""
+    urls = benchmark_urls(team)
+    for name in names or []:
+        if name not in urls:
+            raise ValueError('No benchmark called %r' % name)
+    client = Client()
+    client.force_login(user)
+
+    results = OrderedDict()
+    for name, url in urls.items():
+        if names and name not in names:
+            continue
+        for _ in range(warmup):
+            fetch(client, url)
+        timings = []
+        query_counts = []
+        for _ in range(repeat):
+            if cold:
+                cache.clear()
+            elapsed, queries = fetch(client, url)
+            timings.append(elapsed)
+            query_counts.append(queries)
+        summary = summarize(timings, query_counts)
+        summary['url'] = url
+        results[name] = summary
+    return results
+
+
+def git_commit():
+    """The commit checked out, if this is a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def database_size(team):
+    """Row counts for knowing what a run was measured against"""
+    return OrderedDict([
+        ('teams', Team.objects.count()),
+        ('dishes', Dish.objects.count()),
+        ('team meals', Meal.objects.filter(team=team).count()),
+        ('team courses', Course.objects.filter(meal__team=team).count()),
+        ('team groceries', GroceryListItem.objects.filter(team=team).count()),
+    ])
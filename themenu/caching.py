@@ -0,0 +1,109 @@
+"""Caching what the read-mostly pages work out
+
+A cached value is keyed on the current version of every scope it depends
+on: CATALOG for the dishes, tags, ingredients and reviews every team
+shares, and team_scope(id) for one team's meals. Writes bump the version
+of their scope once they are committed (see signals.py), so the next read
+looks under a new key and the old entries are left to expire. Nothing
+needs to be found and deleted, and a cache hit costs two round trips to
+the cache and none to the database.
+
+The time of the last bump is kept too, for the Last-Modified of pages
+built from the scope.
+
+All of this needs one cache that every process shares. With a cache
+that lives inside each process (settings fall back to LocMemCache when
+memcached isn't configured), a bump in one worker would never reach the
+others, so nothing is cached at all."""
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+
+CATALOG = 'catalog'
+
+# How long a cached value lives if its scopes never change
+CACHE_TIMEOUT = 60 * 60
+
+_MISSING = object()
+
+# Backends whose entries only the process that wrote them can see
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def cache_is_shared():
+    """Whether every process reads and writes the same cache"""
+    return not isinstance(caches['default'], PROCESS_LOCAL_BACKENDS)
+
+
+def team_scope(team_id):
+    return 'team:%s' % team_id
+
+
+def version_key(scope):
+    return 'version:%s' % scope
+
+
+def modified_key(scope):
+    return 'modified:%s' % scope
+
+
+def new_version():
+    """A starting version that won't collide with one used before the
+    version was evicted from the cache"""
+    return int(time.time() * 1000)
+
+
+def scope_versions(scopes):
+    """The current version of each scope, in one cache read"""
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(scope):
+    """Make everything cached under scope stale once the current
+    transaction commits, so nothing can be cached from before the write
+    under the new version"""
+    def bump():
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.set(version_key(scope), new_version(), None)
+        cache.set(modified_key(scope), timezone.now(), None)
+    transaction.on_commit(bump)
+
+
+def scope_modified(scope):
+    """When scope last changed, as far as the cache remembers
+
+    If it has forgotten, the answer is now, which is never too early."""
+    key = modified_key(scope)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, timezone.now(), None)
+        modified = cache.get(key)
+    return modified
+
+
+def cached(name, scopes, compute, timeout=CACHE_TIMEOUT):
+    """compute(), or what it returned last time if nothing in scopes has
+    changed since. name must say everything else the value depends on.
+
+    Without a shared cache it is always compute()."""
+    if not cache_is_shared():
+        return compute()
+    versions = scope_versions(scopes)
+    key = '%s:%s' % (name, ':'.join(str(version) for version in versions))
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
@@ -0,0 +1,111 @@
+"""Answering conditional GETs for the pages built from a team's plans
+
+Each team has a modified_at that touch_team moves forward in the same
+transaction as any write to its meals, courses or groceries. The calendar,
+the grocery list and the api give an ETag and Last-Modified made from it
+and from the catalog's version, so a client asking again gets a 304 after
+one small query, before the view loads anything.
+
+Writes that don't go through the views or signals (the admin's bulk
+actions, the shell) need to call touch_team themselves.
+
+The catalog's version lives in the cache, so pages built from it only
+get an ETag or Last-Modified when every process shares that cache (see
+caching.cache_is_shared)."""
+import hashlib
+from datetime import date, datetime, time
+
+from django.apps import apps
+from django.utils import timezone
+
+from themenu.caching import CATALOG, cache_is_shared, scope_modified, scope_versions
+from themenu.models import (
+    Course, Dish, DishReview, GroceryListItem, Ingredient, IngredientAmount,
+    Meal, RandomGroceryItem, Tag, Team,
+)
+
+# Api models whose rows only change along with their team's modified_at
+TEAM_MODELS = (Meal, Course, GroceryListItem, RandomGroceryItem)
+
+# Api models whose rows only change along with the catalog's version
+CATALOG_MODELS = (Dish, Tag, Ingredient, IngredientAmount, DishReview)
+
+
+def touch_team(team_id):
+    """Mark the team's pages as changed"""
+    if team_id is not None:
+        Team.objects.filter(id=team_id).update(modified_at=timezone.now())
+
+
+def team_modified(request):
+    """(id, modified_at) of the user's team, or (None, None), read with
+    one query the first time it's asked for during a request"""
+    if not hasattr(request, '_team_modified'):
+        state = None
+        if request.user.is_authenticated():
+            state = Team.objects.filter(myuser__user=request.user)\
+                                .values_list('id', 'modified_at')\
+                                .first()
+        request._team_modified = state or (None, None)
+    return request._team_modified
+
+
+def make_etag(request, *versions):
+    """An ETag for this url as seen by this user with these versions of
+    what it shows"""
+    key = '|'.join(str(part) for part in (request.get_full_path(), request.user.pk) + versions)
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def start_of_today():
+    return timezone.make_aware(datetime.combine(date.today(), time.min))
+
+
+def team_page_etag(request, *args, **kwargs):
+    """For pages showing the team's plans from today or a date range,
+    with dish, tag and ingredient names from the catalog"""
+    if not cache_is_shared():
+        return None
+    team_id, modified_at = team_modified(request)
+    if team_id is None:
+        return None
+    return make_etag(request, team_id, modified_at.isoformat(),
+                     scope_versions([CATALOG])[0], date.today())
+
+
+def team_page_last_modified(request, *args, **kwargs):
+    if not cache_is_shared():
+        return None
+    team_id, modified_at = team_modified(request)
+    if team_id is None:
+        return None
+    return max(modified_at, scope_modified(CATALOG), start_of_today())
+
+
+def api_model(model_name):
+    try:
+        return apps.get_model('themenu', model_name.title())
+    except LookupError:
+        return None
+
+
+def api_etag(request, model_name):
+    """For the api's rows of a model whose changes are tracked, else None"""
+    model = api_model(model_name)
+    if model in TEAM_MODELS:
+        team_id, modified_at = team_modified(request)
+        if team_id is None:
+            return None
+        return make_etag(request, team_id, modified_at.isoformat())
+    if model in CATALOG_MODELS and cache_is_shared():
+        return make_etag(request, scope_versions([CATALOG])[0])
+    return None
+
+
+def api_last_modified(request, model_name):
+    model = api_model(model_name)
+    if model in TEAM_MODELS:
+        return team_modified(request)[1]
+    if model in CATALOG_MODELS and cache_is_shared():
+        return scope_modified(CATALOG)
+    return None
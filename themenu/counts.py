@@ -0,0 +1,87 @@
+"""Keeping count of how many things use each tag and ingredient
+
+Tag.dish_count, ingredient_count and meal_count and Ingredient.dish_count
+are shown wherever tags and ingredients are listed, so rather than
+counting the m2m tables on every page they are counted again for just the
+tags or ingredients a change touches (see signals.py). Each recount is
+one UPDATE over the rows of those few, so it is right however the dishes
+were changed.
+
+An ingredient is counted once per dish, however many of its amounts the
+dish lists.
+
+Changes that skip the signals (raw SQL, loaddata) leave the counts behind
+until the reconcile_counts command is run."""
+from django.db import connection
+
+from themenu.models import Dish, Ingredient, Meal
+
+# m2m table -> the Tag field counting its rows
+TAG_COUNT_FIELDS = {
+    Dish.tags.through: 'dish_count',
+    Ingredient.tags.through: 'ingredient_count',
+    Meal.tags.through: 'meal_count',
+}
+
+RECOUNT_TAGS_SQL = """
+UPDATE themenu_tag SET {field} =
+    (SELECT COUNT(*) FROM {table} WHERE {table}.tag_id = themenu_tag.id)
+{where}
+"""
+
+
+def recount_tags(through, tag_ids=None):
+    """Count one m2m table's rows again for these tags, or for every tag"""
+    if tag_ids is not None:
+        tag_ids = list(set(tag_ids))
+        if not tag_ids:
+            return
+    sql = RECOUNT_TAGS_SQL.format(field=TAG_COUNT_FIELDS[through],
+                                  table=through._meta.db_table,
+                                  where='' if tag_ids is None else 'WHERE id = ANY(%s)')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [] if tag_ids is None else [tag_ids])
+
+
+# Counts again the ingredients picked out by {where}
+RECOUNT_INGREDIENTS_SQL = """
+UPDATE themenu_ingredient SET dish_count = (
+    SELECT COUNT(DISTINCT themenu_dish_ingredient_amounts.dish_id)
+    FROM themenu_dish_ingredient_amounts
+    JOIN themenu_ingredientamount
+        ON themenu_ingredientamount.id = themenu_dish_ingredient_amounts.ingredientamount_id
+    WHERE themenu_ingredientamount.ingredient_id = themenu_ingredient.id)
+{where}
+"""
+
+
+def recount_ingredients(ingredient_ids=None):
+    """Count the dishes using these ingredients again, or every ingredient"""
+    if ingredient_ids is not None:
+        ingredient_ids = list(set(ingredient_ids))
+        if not ingredient_ids:
+            return
+    sql = RECOUNT_INGREDIENTS_SQL.format(
+        where='' if ingredient_ids is None else 'WHERE id = ANY(%s)')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [] if ingredient_ids is None else [ingredient_ids])
+
+
+def recount_amount_ingredients(amount_ids):
+    """Count the dishes again for the ingredients of these ingredient amounts"""
+    amount_ids = list(set(amount_ids))
+    if not amount_ids:
+        return
+    sql = RECOUNT_INGREDIENTS_SQL.format(
+        where='WHERE id IN (SELECT ingredient_id FROM themenu_ingredientamount '
+              'WHERE id = ANY(%s))')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [amount_ids])
+
+
+def reconcile_counts():
+    """Count every tag's and ingredient's uses from scratch"""
+    for through in TAG_COUNT_FIELDS:
+        recount_tags(through)
+    recount_ingredients()
+
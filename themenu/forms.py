@@ -45,6 +45,12 @@ class IngredientSearchForm(forms.ModelForm):
         }
 
 
+class CookWithForm(forms.Form):
+    """Pick ingredients to find the dishes that use them all"""
+    ingredients = forms.ModelMultipleChoiceField(queryset=Ingredient.objects.all(),
+                                                 widget=NameSelect2MultipleWidget)
+
+
 class IngredientField(forms.ModelMultipleChoiceField):
     def to_python(self, value):
         if not value:
@@ -0,0 +1,229 @@
+"""Keeping the grocery list in step with the planned courses
+
+Each course gets one GroceryListItem per ingredient amount of its dish.
+Rather than checking ingredients one at a time, the wanted
+(course, ingredient amount) pairs are compared with the existing ones as
+sets and the difference is written in one insert and one delete.
+
+Each item also carries its meal's team and date and its ingredient, set
+when it is made and updated when the meal or amount changes (see
+signals.py), so the list is read from its (team, meal_date) index
+without joining through courses and meals."""
+from collections import defaultdict, OrderedDict
+
+from django.contrib.postgres.aggregates import ArrayAgg, BoolAnd, StringAgg
+from django.db import transaction
+from django.db.models import Case, CharField, F, Sum, Value, When
+
+from themenu.conditional import touch_team
+from themenu.models import Dish, GroceryListItem, RandomGroceryItem
+from themenu.quantities import format_quantity
+
+
+def wanted_groceries(courses):
+    """The (course id, ingredient amount id) pairs that should be on the
+    grocery list for these courses, and a dict of the amounts' ingredient ids
+
+    Leftover meals don't need any shopping."""
+    courses_by_dish = defaultdict(list)
+    for course in courses:
+        if course.meal.meal_prep != 'leftover':
+            courses_by_dish[course.dish_id].append(course.id)
+    if not courses_by_dish:
+        return set(), {}
+
+    DishAmount = Dish.ingredient_amounts.through
+    dish_amounts = DishAmount.objects.filter(dish_id__in=courses_by_dish)\
+                                     .values_list('dish_id', 'ingredientamount_id',
+                                                  'ingredientamount__ingredient_id')
+    wanted = set()
+    ingredient_ids = {}
+    for dish_id, ing_amt_id, ingredient_id in dish_amounts:
+        ingredient_ids[ing_amt_id] = ingredient_id
+        for course_id in courses_by_dish[dish_id]:
+            wanted.add((course_id, ing_amt_id))
+    return wanted, ingredient_ids
+
+
+def sync_course_groceries(courses):
+    """Add and remove GroceryListItems so each course has exactly one
+    for every ingredient amount of its dish
+
+    Groceries that aren't needed anymore are only removed if they
+    haven't been bought yet."""
+    courses = list(courses)
+    if not courses:
+        return
+    wanted, ingredient_ids = wanted_groceries(courses)
+    meals = {course.id: course.meal for course in courses}
+
+    existing = GroceryListItem.objects.filter(course__in=courses)\
+                                      .values_list('id', 'course_id',
+                                                   'ingredient_amount_id', 'purchased')
+    have = set()
+    stale_ids = []
+    for grocery_id, course_id, ing_amt_id, purchased in existing:
+        pair = (course_id, ing_amt_id)
+        if pair in wanted and pair not in have:
+            have.add(pair)
+        elif not purchased:
+            stale_ids.append(grocery_id)
+
+    new_groceries = [GroceryListItem(course_id=course_id, ingredient_amount_id=ing_amt_id,
+                                     team_id=meals[course_id].team_id,
+                                     meal_date=meals[course_id].date,
+                                     ingredient_id=ingredient_ids[ing_amt_id])
+                     for course_id, ing_amt_id in wanted - have]
+    if not (new_groceries or stale_ids):
+        return
+    with transaction.atomic():
+        if new_groceries:
+            GroceryListItem.objects.bulk_create(new_groceries)
+        if stale_ids:
+            GroceryListItem.objects.filter(id__in=stale_ids).delete()
+        for team_id in set(meal.team_id for meal in meals.values()):
+            touch_team(team_id)
+
+
+def mark_course_groceries_purchased(courses):
+    """Once a course is made or eaten, its groceries must have been bought
+
+    Only called along with the write to the courses, which touches the team."""
+    GroceryListItem.objects.filter(course__in=courses).update(purchased=True)
+
+
+def copy_meal_to_groceries(meal):
+    """Give the meal's groceries its team and date, if they don't have them"""
+    GroceryListItem.objects.filter(course__meal=meal)\
+                           .exclude(team_id=meal.team_id, meal_date=meal.date)\
+                           .update(team_id=meal.team_id, meal_date=meal.date)
+
+
+def copy_ingredient_to_groceries(ingredient_amount):
+    """Give the amount's groceries its ingredient, if they don't have it,
+    and touch the teams whose lists changed"""
+    groceries = GroceryListItem.objects.filter(ingredient_amount=ingredient_amount)\
+                                       .exclude(ingredient_id=ingredient_amount.ingredient_id)
+    team_ids = set(groceries.values_list('team_id', flat=True))
+    if not team_ids:
+        return
+    with transaction.atomic():
+        groceries.update(ingredient_id=ingredient_amount.ingredient_id)
+        for team_id in team_ids:
+            touch_team(team_id)
+
+
+def team_groceries(team, since):
+    """The grocery items for a team's meals on or after a date"""
+    return GroceryListItem.objects.filter(team=team, meal_date__gte=since)
+
+
+def grocery_groups(team, since):
+    """The grocery list grouped by ingredient, added up by the database
+
+    Parsed quantities are summed per ingredient and unit (plain counts like
+    "2 medium" per descriptor), and amounts that couldn't be read are kept
+    as typed. What's said after a unit, like "chopped" in "1 cup, chopped",
+    doesn't stop amounts adding up, and is shown after the total.
+    Returns one dict per ingredient with its name, the amounts as one
+    string, whether they have all been purchased and the grocery ids.
+    Groups that still need buying come first."""
+    count_of = Case(When(ingredient_amount__unit='', then=F('ingredient_amount__descriptor')),
+                    default=Value(''),
+                    output_field=CharField())
+    notes = Case(When(ingredient_amount__unit='', then=Value('')),
+                 default=F('ingredient_amount__descriptor'),
+                 output_field=CharField())
+    unread = Case(When(ingredient_amount__amount='', then=Value('N/A')),
+                  When(ingredient_amount__quantity__isnull=True,
+                       then=F('ingredient_amount__amount')),
+                  output_field=CharField())
+    totals = team_groceries(team, since)\
+        .annotate(ingredient_name=F('ingredient__name'),
+                  unit=F('ingredient_amount__unit'),
+                  count_of=count_of)\
+        .values('ingredient_name', 'unit', 'count_of')\
+        .annotate(total=Sum('ingredient_amount__quantity'),
+                  unread=StringAgg(unread, ', '),
+                  notes=ArrayAgg(notes),
+                  all_purchased=BoolAnd('purchased'),
+                  ids=ArrayAgg('id'))\
+        .order_by('ingredient_name', 'unit', 'count_of')
+
+    # Each ingredient only has a row per unit, so this is a short loop
+    groups = OrderedDict()
+    for row in totals:
+        group = groups.setdefault(row['ingredient_name'], {
+            'ingredient_name': row['ingredient_name'],
+            'amounts': [],
+            'all_purchased': True,
+            'ids': [],
+        })
+        if row['total'] is not None:
+            amount = format_quantity(row['total'], row['unit'], row['count_of'])
+            notes = sorted(set(note for note in row['notes'] if note))
+            if notes:
+                amount += ' (%s)' % ', '.join(notes)
+            group['amounts'].append(amount)
+        if row['unread']:
+            group['amounts'].append(row['unread'])
+        group['all_purchased'] = group['all_purchased'] and row['all_purchased']
+        group['ids'].extend(row['ids'])
+
+    for group in groups.values():
+        group['amounts'] = ', '.join(group['amounts'])
+    return sorted(groups.values(), key=lambda group: group['all_purchased'])
+
+
+def grocery_details(team, since):
+    """The individual grocery items with the meal and dish they're for,
+    as a dict of ingredient name -> list of GroceryListItems"""
+    groceries = team_groceries(team, since)\
+        .annotate(ingredient_name=F('ingredient__name'))\
+        .select_related('course__dish', 'course__meal')\
+        .order_by('meal_date')
+    details = defaultdict(list)
+    for grocery in groceries:
+        details[grocery.ingredient_name].append(grocery)
+    return details
+
+
+def team_grocery_querysets(team):
+    """What each kind of grocery on the list is, limited to one team
+
+    Raises ValueError when there is no team, since filtering on team=None
+    would match every grocery that hasn't been given one."""
+    if team is None:
+        raise ValueError('No team')
+    return {
+        'meal': GroceryListItem.objects.filter(team=team),
+        'random': RandomGroceryItem.objects.filter(team=team),
+    }
+
+
+def set_groceries_purchased(team, updates):
+    """Check off (or uncheck) any number of groceries at once
+
+    updates is a list of (grocery type, ids, purchased) in the order they
+    happened, where the type is 'meal' or 'random'. If an id shows up more
+    than once the last update wins. All the ids of a type that end up with
+    the same value are written with one UPDATE.
+    Returns the number of rows changed for each type."""
+    latest = defaultdict(dict)
+    for grocery_type, ids, purchased in updates:
+        for grocery_id in ids:
+            latest[grocery_type][grocery_id] = purchased
+
+    querysets = team_grocery_querysets(team)
+    counts = {grocery_type: 0 for grocery_type in querysets}
+    with transaction.atomic():
+        for grocery_type, purchased_by_id in latest.items():
+            for purchased in (True, False):
+                ids = [grocery_id for grocery_id, value in purchased_by_id.items()
+                       if value == purchased]
+                if ids:
+                    counts[grocery_type] += querysets[grocery_type].filter(id__in=ids)\
+                                                                   .update(purchased=purchased)
+        if any(counts.values()):
+            touch_team(team.id)
+    return counts
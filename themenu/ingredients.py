@@ -0,0 +1,70 @@
+"""Saving a dish's ingredients, and finding the dishes that use some
+
+A dish's ingredient amounts are written by set_dish_ingredients in a
+fixed number of queries however long the recipe is.
+
+A dish is matched with one IN (subquery) per ingredient on the dish to
+ingredient amount table, so it comes back once however many amounts of
+the ingredient it lists, and a staple in most dishes costs a semi-join
+rather than a row per amount. Only the page of dishes being shown is
+loaded, with its matching amounts, its tags and how many meals it has
+been in fetched in one query each."""
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import transaction
+from django.db.models import Count, Prefetch
+
+from themenu.amounts import intern_amounts
+from themenu.models import Course, Dish, IngredientAmount
+
+DISH_PAGE_SIZE = 30
+
+
+def set_dish_ingredients(dish, pairs):
+    """Make the dish's ingredient amounts exactly the (ingredient id,
+    amount text) pairs given
+
+    Only the amounts the dish didn't have are added and only the ones
+    it no longer has are removed, each in one statement."""
+    with transaction.atomic():
+        dish.ingredient_amounts.set(intern_amounts(pairs))
+
+
+def dishes_using(ingredient_ids):
+    """The dishes using every one of these ingredients, in name order"""
+    DishAmount = Dish.ingredient_amounts.through
+    dishes = Dish.objects.all()
+    for ingredient_id in set(ingredient_ids):
+        amounts = DishAmount.objects.filter(ingredientamount__ingredient_id=ingredient_id)
+        dishes = dishes.filter(id__in=amounts.values('dish_id'))
+    return dishes.order_by('name', 'id')
+
+
+def dish_page(ingredient_ids, page_number=1, per_page=DISH_PAGE_SIZE):
+    """One page of dishes_using(ingredient_ids), in five queries
+
+    Each dish on the page has matching_amounts (its amounts of these
+    ingredients), its tags prefetched and meal_count, the number of
+    meals it has been planned for. Page numbers past either end give the
+    nearest page."""
+    ingredient_ids = list(ingredient_ids)
+    paginator = Paginator(dishes_using(ingredient_ids).only('id', 'name'), per_page)
+    try:
+        page = paginator.page(page_number)
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    matching = IngredientAmount.objects.filter(ingredient_id__in=ingredient_ids)\
+                                       .select_related('ingredient')
+    dishes = list(page.object_list.prefetch_related(
+        Prefetch('ingredient_amounts', queryset=matching, to_attr='matching_amounts'),
+        'tags'))
+    meal_counts = dict(Course.objects.filter(dish__in=dishes)
+                                     .order_by()
+                                     .values_list('dish_id')
+                                     .annotate(Count('id')))
+    for dish in dishes:
+        dish.meal_count = meal_counts.get(dish.id, 0)
+    page.object_list = dishes
+    return page
@@ -0,0 +1,77 @@
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from themenu.benchmarks import benchmark_urls, database_size, git_commit, run_benchmarks
+from themenu.models import MyUser, Team
+
+
+class Command(BaseCommand):
+    help = '''
+        Times the calendar, grocery list, team, scores and api pages for
+        one member of a team and writes the latency percentiles and
+        query counts of each as json, to compare across commits. Fill the
+        database with generate_data first.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--team', type=int,
+                            help='The team to view the pages as (default: the one with most meals)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='How many timed requests to make per page')
+        parser.add_argument('--warmup', type=int, default=2,
+                            help='How many untimed requests to make per page first')
+        parser.add_argument('--cold', action='store_true',
+                            help='Clear the cache before every timed request')
+        parser.add_argument('--only', action='append', metavar='NAME',
+                            help='Only time this page (can be given more than once)')
+        parser.add_argument('--list', action='store_true',
+                            help='List the pages that can be timed and stop')
+        parser.add_argument('--output',
+                            help='Write the json to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['team']:
+            team = Team.objects.filter(id=options['team']).first()
+        else:
+            team = Team.objects.annotate(meals=Count('meal')).order_by('-meals', 'id').first()
+        if team is None:
+            raise CommandError('No such team')
+        myuser = MyUser.objects.filter(team=team).select_related('user').order_by('id').first()
+        if myuser is None:
+            raise CommandError('%s has no members to view the pages as' % team)
+
+        if options['list']:
+            for name, url in benchmark_urls(team).items():
+                self.stdout.write('%-20s %s' % (name, url))
+            return
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+
+        try:
+            results = run_benchmarks(myuser.user, team, names=options['only'],
+                                     repeat=options['repeat'], warmup=options['warmup'],
+                                     cold=options['cold'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = OrderedDict([
+            ('commit', git_commit()),
+            ('run_at', datetime.now().isoformat()),
+            ('team', team.id),
+            ('repeat', options['repeat']),
+            ('warmup', options['warmup']),
+            ('cold', options['cold']),
+            ('database', database_size(team)),
+            ('views', results),
+        ])
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS('Wrote %s.' % options['output']))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from themenu.amounts import compact_ingredient_amounts
+from themenu.caching import CATALOG, bump_version
+
+
+class Command(BaseCommand):
+    help = '''
+        Merges ingredient amounts that only differ in spaces or capitals,
+        moving their dishes and grocery list items to the one kept.
+        Only needed if amounts were saved without going through the site.
+    '''
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), connection.cursor() as cursor:
+            merged = compact_ingredient_amounts(cursor)
+            bump_version(CATALOG)
+        self.stdout.write(self.style.SUCCESS('Merged %d ingredient amounts.' % merged))
@@ -0,0 +1,94 @@
+import json
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from themenu.groceries import team_groceries
+from themenu.models import Course, Meal, RandomGroceryItem, Team, TeamDishStats
+from themenu.plans import team_meals, week_range
+
+# Ways of reading a table that go through an index
+INDEX_SCANS = ('Index Scan', 'Index Only Scan', 'Bitmap Heap Scan')
+
+
+def hot_queries(team):
+    """(name, queryset) for the queries run on every calendar, grocery
+    list and team page"""
+    today = date.today()
+    start, end = week_range(today, today + timedelta(weeks=3))
+    return [
+        ('calendar meals', team_meals(team, start, end)),
+        ('calendar courses', Course.objects.filter(meal__team=team, meal__date__range=(start, end))),
+        ('grocery list', team_groceries(team, today).select_related('ingredient_amount')),
+        ('random groceries', RandomGroceryItem.objects.filter(team=team, purchased=False)),
+        ('cooked leaderboard', Course.objects.filter(meal__team=team, meal__meal_prep='cook',
+                                                     meal__date__range=(today - timedelta(days=29),
+                                                                        today))),
+        ('planning coverage', Meal.objects.filter(team=team, date__lte=today)
+                                          .order_by()
+                                          .values('meal_type')),
+        ('dish stats', TeamDishStats.objects.filter(team=team).order_by('-planned')[:10]),
+    ]
+
+
+def plan_scans(plan):
+    """(node type, table) for every scan of a table in an EXPLAIN plan"""
+    scans = []
+    if 'Relation Name' in plan:
+        scans.append((plan['Node Type'], plan['Relation Name']))
+    for child in plan.get('Plans', []):
+        scans.extend(plan_scans(child))
+    return scans
+
+
+def explain_scans(cursor, queryset):
+    """(node type, table) for every scan of a table in a queryset's plan"""
+    sql, params = queryset.query.sql_with_params()
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return plan_scans(plan[0]['Plan'])
+
+
+class Command(BaseCommand):
+    help = '''
+        EXPLAINs the queries behind the calendar, grocery list and team
+        pages for one team and fails if any of them reads a whole table.
+        Run it on a database the size of production's (generate_data can
+        make one): on a small one Postgres rightly prefers sequential
+        scans, unless --no-seqscan is given to check that an index could
+        be used.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--team', type=int,
+                            help='The team to explain the queries for (default: the first)')
+        parser.add_argument('--no-seqscan', action='store_true',
+                            help='Tell Postgres to avoid sequential scans where it can')
+
+    def handle(self, *args, **options):
+        teams = Team.objects.order_by('id')
+        team = teams.filter(id=options['team']).first() if options['team'] else teams.first()
+        if team is None:
+            raise CommandError('No such team')
+
+        queries = hot_queries(team)
+        failures = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            if options['no_seqscan']:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in queries:
+                scans = explain_scans(cursor, queryset)
+                seq_scans = [table for node, table in scans if node not in INDEX_SCANS]
+                status = 'SEQ SCAN on %s' % ', '.join(seq_scans) if seq_scans else 'ok'
+                self.stdout.write('%-20s %s' % (name, status))
+                for node, table in scans:
+                    self.stdout.write('    %s on %s' % (node, table))
+                if seq_scans:
+                    failures.append(name)
+
+        if failures:
+            raise CommandError('Not using an index: %s' % ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS('All %d queries use indexes.' % len(queries)))
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from themenu.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = '''
+        Adds made-up teams, users, dishes, ingredients, reviews and years
+        of meals and groceries, for measuring the site at a realistic size
+        with the benchmark and explain_hot_queries commands. Don't run it
+        on production's database.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teams', type=int, default=10)
+        parser.add_argument('--users-per-team', type=int, default=3)
+        parser.add_argument('--years', type=int, default=2,
+                            help='How many years of meals each team has planned')
+        parser.add_argument('--days-ahead', type=int, default=14,
+                            help='How many days past today meals are planned for')
+        parser.add_argument('--dishes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--amounts-per-ingredient', type=int, default=4)
+        parser.add_argument('--ingredients-per-dish', type=int, default=8,
+                            help='About how many ingredients each dish lists')
+        parser.add_argument('--tags', type=int, default=40)
+        parser.add_argument('--reviews-per-dish', type=int, default=2,
+                            help='About how many reviews each dish gets')
+        parser.add_argument('--favorites', type=int, default=150,
+                            help='How many dishes each team cooks most of the time')
+        parser.add_argument('--random-groceries', type=int, default=10,
+                            help='Random grocery items per team')
+        parser.add_argument('--seed', type=int,
+                            help='Seed the random choices, to make the same data again')
+        parser.add_argument('--prefix',
+                            help='Start of the new names (default: one unique to this run)')
+
+    def handle(self, *args, **options):
+        if options['teams'] < 1 or options['users_per_team'] < 1 or options['dishes'] < 1 \
+                or options['ingredients'] < 1 or options['amounts_per_ingredient'] < 1:
+            raise CommandError('Need at least one team, user, dish, ingredient and amount')
+        prefix = options['prefix'] or 'synth%x' % int(time.time())
+
+        started = time.time()
+        made = generate(prefix,
+                        teams=options['teams'],
+                        users_per_team=options['users_per_team'],
+                        years=options['years'],
+                        days_ahead=options['days_ahead'],
+                        dishes=options['dishes'],
+                        ingredients=options['ingredients'],
+                        amounts_per_ingredient=options['amounts_per_ingredient'],
+                        ingredients_per_dish=options['ingredients_per_dish'],
+                        tags=options['tags'],
+                        reviews_per_dish=options['reviews_per_dish'],
+                        favorites=options['favorites'],
+                        random_groceries=options['random_groceries'],
+                        seed=options['seed'])
+        for what, count in made:
+            self.stdout.write('%-20s %d' % (what, count))
+        self.stdout.write(self.style.SUCCESS('Generated %s in %.1fs.' % (
+            prefix, time.time() - started)))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from themenu.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = '''
+        Rebuilds the full-text search vector of every dish.
+        Only needed if dishes were changed without going through the ORM.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='How many dishes to update per query')
+
+    def handle(self, *args, **options):
+        count = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Rebuilt the search index for %d dishes.' % count))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from themenu.models import Team
+from themenu.stats import rebuild_team_stats
+
+
+class Command(BaseCommand):
+    help = '''
+        Works out every team's stats again from their meals and courses.
+        Only needed if meals were changed without going through the site.
+    '''
+
+    def add_arguments(self, parser):
+        parser.add_argument('team_ids', nargs='*', type=int,
+                            help='Only rebuild these teams')
+
+    def handle(self, *args, **options):
+        team_ids = options['team_ids'] or Team.objects.values_list('id', flat=True)
+        count = 0
+        for team_id in team_ids:
+            rebuild_team_stats(team_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('Rebuilt the stats for %d teams.' % count))
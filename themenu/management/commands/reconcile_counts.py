@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from themenu.counts import reconcile_counts
+from themenu.models import Ingredient, Tag
+
+
+class Command(BaseCommand):
+    help = '''
+        Counts every tag's dishes, ingredients and meals and every
+        ingredient's dishes again. Only needed if they were changed
+        without going through the site.
+    '''
+
+    def handle(self, *args, **options):
+        reconcile_counts()
+        self.stdout.write(self.style.SUCCESS('Recounted %d tags and %d ingredients.' % (
+            Tag.objects.count(), Ingredient.objects.count())))
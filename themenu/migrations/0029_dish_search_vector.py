@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 17:02
+from __future__ import unicode_literals
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0028_ingredientamount_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX themenu_dish_search_vector_gin ON themenu_dish USING gin (search_vector)',
+            'DROP INDEX themenu_dish_search_vector_gin',
+        ),
+        # Fill in the vectors of the dishes already in the catalogue
+        migrations.RunSQL(
+            """
+            UPDATE themenu_dish SET search_vector =
+                setweight(to_tsvector('english', coalesce(themenu_dish.name, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce((
+                    SELECT string_agg(themenu_tag.name, ' ')
+                    FROM themenu_tag
+                    JOIN themenu_dish_tags ON themenu_dish_tags.tag_id = themenu_tag.id
+                    WHERE themenu_dish_tags.dish_id = themenu_dish.id), '')), 'B') ||
+                setweight(to_tsvector('english', coalesce((
+                    SELECT string_agg(themenu_ingredient.name, ' ')
+                    FROM themenu_ingredient
+                    JOIN themenu_ingredientamount
+                        ON themenu_ingredientamount.ingredient_id = themenu_ingredient.id
+                    JOIN themenu_dish_ingredient_amounts
+                        ON themenu_dish_ingredient_amounts.ingredientamount_id = themenu_ingredientamount.id
+                    WHERE themenu_dish_ingredient_amounts.dish_id = themenu_dish.id), '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(themenu_dish.notes, '')), 'C') ||
+                setweight(to_tsvector('english', coalesce(themenu_dish.recipe, '')), 'D')
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 17:41
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0029_dish_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamDishStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('planned', models.IntegerField(default=0)),
+                ('cooked', models.IntegerField(default=0)),
+                ('eaten', models.IntegerField(default=0)),
+                ('dish', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='themenu.Dish')),
+            ],
+            options={
+                'verbose_name_plural': 'team dish stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='TeamStats',
+            fields=[
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='themenu.Team')),
+                ('first_meal_date', models.DateField(blank=True, null=True)),
+                ('breakfasts', models.IntegerField(default=0)),
+                ('lunches', models.IntegerField(default=0)),
+                ('dinners', models.IntegerField(default=0)),
+                ('desserts', models.IntegerField(default=0)),
+                ('snacks', models.IntegerField(default=0)),
+                ('tapas', models.IntegerField(default=0)),
+                ('cook_courses', models.IntegerField(default=0)),
+                ('prepared_cook_courses', models.IntegerField(default=0)),
+                ('eaten_cook_courses', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'team stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='teamdishstats',
+            name='team',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='themenu.Team'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='teamdishstats',
+            unique_together=set([('team', 'dish')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 18:05
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0030_teamstats'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='meal',
+            index_together=set([('team', 'meal_prep', 'date')]),
+        ),
+    ]
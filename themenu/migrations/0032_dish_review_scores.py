@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 18:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0031_meal_team_prep_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dish',
+            name='avg_ease',
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='avg_fastness',
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='avg_results',
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dish',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        # Copy the scores of the reviews written so far
+        migrations.RunSQL(
+            """
+            UPDATE themenu_dish
+            SET review_count = scores.review_count,
+                avg_fastness = scores.avg_fastness,
+                avg_ease = scores.avg_ease,
+                avg_results = scores.avg_results
+            FROM (SELECT dish_id,
+                         COUNT(*) AS review_count,
+                         AVG(fastness) AS avg_fastness,
+                         AVG(ease) AS avg_ease,
+                         AVG(results) AS avg_results
+                  FROM themenu_dishreview
+                  GROUP BY dish_id) AS scores
+            WHERE scores.dish_id = themenu_dish.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
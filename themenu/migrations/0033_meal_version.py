@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 19:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0032_dish_review_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 16:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0034_team_modified_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='dish_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='ingredient_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='meal_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        # Count the tags already in use
+        migrations.RunSQL(
+            """
+            UPDATE themenu_tag SET
+                dish_count = (SELECT COUNT(*) FROM themenu_dish_tags
+                              WHERE themenu_dish_tags.tag_id = themenu_tag.id),
+                ingredient_count = (SELECT COUNT(*) FROM themenu_ingredient_tags
+                                    WHERE themenu_ingredient_tags.tag_id = themenu_tag.id),
+                meal_count = (SELECT COUNT(*) FROM themenu_meal_tags
+                              WHERE themenu_meal_tags.tag_id = themenu_tag.id)
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
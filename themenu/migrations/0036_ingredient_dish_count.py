@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 16:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0035_tag_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='dish_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        # Count the dishes of the ingredients already in use
+        migrations.RunSQL(
+            """
+            UPDATE themenu_ingredient SET dish_count = (
+                SELECT COUNT(DISTINCT themenu_dish_ingredient_amounts.dish_id)
+                FROM themenu_dish_ingredient_amounts
+                JOIN themenu_ingredientamount
+                    ON themenu_ingredientamount.id = themenu_dish_ingredient_amounts.ingredientamount_id
+                WHERE themenu_ingredientamount.ingredient_id = themenu_ingredient.id)
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
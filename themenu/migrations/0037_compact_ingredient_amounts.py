@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 16:42
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# A copy of themenu.amounts.COMPACT_AMOUNTS_SQL as it was when this
+# migration was written, so later changes to it don't change what this
+# migration does
+
+# Run in order, in one transaction. amount_merges maps each duplicate to
+# the oldest amount with the same normalized ingredient and text.
+COMPACT_AMOUNTS_SQL = [
+    """
+    CREATE TEMPORARY TABLE amount_merges AS
+    SELECT id, keep_id FROM (
+        SELECT id, MIN(id) OVER (PARTITION BY ingredient_id, lower(
+            regexp_replace(regexp_replace(amount, '^\\s+|\\s+$', '', 'g'), '\\s+', ' ', 'g')
+        )) AS keep_id
+        FROM themenu_ingredientamount) AS amounts
+    WHERE id <> keep_id
+    """,
+    """
+    INSERT INTO themenu_dish_ingredient_amounts (dish_id, ingredientamount_id)
+    SELECT DISTINCT dish_amounts.dish_id, amount_merges.keep_id
+    FROM themenu_dish_ingredient_amounts AS dish_amounts
+    JOIN amount_merges ON amount_merges.id = dish_amounts.ingredientamount_id
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    DELETE FROM themenu_dish_ingredient_amounts USING amount_merges
+    WHERE themenu_dish_ingredient_amounts.ingredientamount_id = amount_merges.id
+    """,
+    """
+    UPDATE themenu_grocerylistitem SET ingredient_amount_id = amount_merges.keep_id
+    FROM amount_merges
+    WHERE themenu_grocerylistitem.ingredient_amount_id = amount_merges.id
+    """,
+    # A course that had groceries for two of the duplicates now has two for
+    # the kept amount. Like sync_course_groceries, keep one, along with any
+    # that were bought.
+    """
+    DELETE FROM themenu_grocerylistitem AS extra USING themenu_grocerylistitem AS kept
+    WHERE NOT extra.purchased
+      AND extra.ingredient_amount_id IN (SELECT keep_id FROM amount_merges)
+      AND kept.course_id = extra.course_id
+      AND kept.ingredient_amount_id = extra.ingredient_amount_id
+      AND (kept.purchased OR kept.id < extra.id)
+    """,
+    """
+    DELETE FROM themenu_ingredientamount USING amount_merges
+    WHERE themenu_ingredientamount.id = amount_merges.id
+    """,
+    """
+    UPDATE themenu_ingredientamount SET amount = lower(
+        regexp_replace(regexp_replace(amount, '^\\s+|\\s+$', '', 'g'), '\\s+', ' ', 'g'))
+    WHERE amount <> lower(
+        regexp_replace(regexp_replace(amount, '^\\s+|\\s+$', '', 'g'), '\\s+', ' ', 'g'))
+    """,
+]
+
+
+def compact_amounts(apps, schema_editor):
+    """Merge amounts that are the same once normalized, as
+    themenu.amounts.compact_ingredient_amounts does"""
+    with schema_editor.connection.cursor() as cursor:
+        for sql in COMPACT_AMOUNTS_SQL:
+            cursor.execute(sql)
+        cursor.execute('DROP TABLE amount_merges')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0036_ingredient_dish_count'),
+    ]
+
+    operations = [
+        # The duplicates have to go before the unique index can be made,
+        # which is done in the next migration, once the deletes are committed
+        migrations.RunPython(compact_amounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 16:42
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0037_compact_ingredient_amounts'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='ingredientamount',
+            unique_together=set([('ingredient', 'amount')]),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 16:44
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0038_ingredientamount_unique'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='meal',
+            unique_together=set([('team', 'date', 'meal_type')]),
+        ),
+        # The grocery list only shows the random groceries still to buy
+        migrations.RunSQL(
+            'CREATE INDEX themenu_randomgroceryitem_unpurchased ON themenu_randomgroceryitem '
+            '(team_id) WHERE NOT purchased',
+            'DROP INDEX themenu_randomgroceryitem_unpurchased',
+        ),
+    ]
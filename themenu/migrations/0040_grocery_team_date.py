@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 16:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('themenu', '0039_team_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grocerylistitem',
+            name='ingredient',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='themenu.Ingredient'),
+        ),
+        migrations.AddField(
+            model_name='grocerylistitem',
+            name='meal_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='grocerylistitem',
+            name='team',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='themenu.Team'),
+        ),
+        migrations.AlterIndexTogether(
+            name='grocerylistitem',
+            index_together=set([('team', 'meal_date')]),
+        ),
+    ]
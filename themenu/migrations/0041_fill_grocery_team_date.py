@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.4 on 2026-10-18 16:46
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Copies the new columns onto the groceries already on the lists
+
+    Kept apart from 0040 so its foreign keys and indexes are in place
+    before rows are written against them."""
+
+    dependencies = [
+        ('themenu', '0040_grocery_team_date'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            """
+            UPDATE themenu_grocerylistitem
+            SET team_id = themenu_meal.team_id, meal_date = themenu_meal.date
+            FROM themenu_course
+            JOIN themenu_meal ON themenu_meal.id = themenu_course.meal_id
+            WHERE themenu_course.id = themenu_grocerylistitem.course_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE themenu_grocerylistitem
+            SET ingredient_id = themenu_ingredientamount.ingredient_id
+            FROM themenu_ingredientamount
+            WHERE themenu_ingredientamount.id = themenu_grocerylistitem.ingredient_amount_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
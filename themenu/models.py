@@ -2,11 +2,15 @@ from __future__ import unicode_literals
 import calendar
 import random
 from django.db import models
-from django.db.models import Count, Min, Avg, Sum, Case, When, IntegerField, DateField, Q
+from django.db.models import Avg, Count, Sum
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
 from django.core.urlresolvers import reverse, reverse_lazy
+from django.utils import timezone
 from datetime import date, datetime
 
+from themenu.quantities import normalize_amount, parse_amount
+
 
 def randcolor():
     return random.choice(Tag.TAG_COLORS)
@@ -15,95 +19,75 @@ def randcolor():
 class Team(models.Model):
     name = models.CharField(max_length=50, unique=True)
 
+    # Moved forward whenever the team's meals, courses or groceries change
+    # (see themenu.conditional), so unchanged pages can be answered with a 304
+    modified_at = models.DateTimeField(default=timezone.now, editable=False)
+
     def get_absolute_url(self):
         return reverse('team-detail', args=[str(self.id)])
 
     def __str__(self):
         return self.name
 
+    def get_stats(self):
+        """The team's running totals (see themenu.stats), worked out from
+        scratch the first time they're asked for"""
+        try:
+            return self.stats
+        except TeamStats.DoesNotExist:
+            from themenu.stats import rebuild_team_stats
+            self.stats = rebuild_team_stats(self.id)
+            return self.stats
+
     def common_ingredients(self):
         """Return a list ingredient objects,
         ordered by those the team most commonly uses"""
 
-        ingredients = Ingredient.objects.filter(ingredientamount__dish__meal__team=self)\
-                                .values("name", "id").distinct()\
-                                .annotate(num_meals=Count('ingredientamount__dish__meal'))\
+        ingredients = Ingredient.objects.filter(ingredientamount__dish__teamdishstats__team=self)\
+                                .values("name", "id")\
+                                .annotate(num_meals=Sum('ingredientamount__dish__teamdishstats__planned'))\
+                                .filter(num_meals__gte=1)\
                                 .order_by('-num_meals')[:10]
         return ingredients
 
     def common_dishes(self):
-        dishes = Dish.objects.filter(meal__team=self).values("name", "id").distinct().annotate(num_meals=Count('meal')).order_by('-num_meals')[:10]
-        return dishes
+        from themenu.stats import dish_leaderboard
+        return dish_leaderboard(self, 'planned')
 
     def cooked_dishes(self):
-        dishes = Dish.objects.\
-            annotate(cooked_meals=Sum(
-                Case(
-                    When(~Q(meal__team=self), then=0),
-                    When(~Q(meal__meal_prep='cook'), then=0),
-                    When(meal__course__prepared=True, then=1),
-                    output_field=IntegerField()
-                )
-            ))\
-            .filter(cooked_meals__gte=1)\
-            .order_by('-cooked_meals')[:10]
-        return dishes
+        from themenu.stats import dish_leaderboard
+        return dish_leaderboard(self, 'cooked')
 
     def eaten_dishes(self):
-        dishes = Dish.objects.\
-            annotate(eaten_meals=Sum(
-                Case(
-                    When(~Q(meal__team=self), then=0),
-                    When(meal__course__eaten=True, then=1),
-                    output_field=IntegerField()
-                )
-            ))\
-            .filter(eaten_meals__gte=1)\
-            .order_by('-eaten_meals')[:10]
-        return dishes
+        from themenu.stats import dish_leaderboard
+        return dish_leaderboard(self, 'eaten')
 
     def prep_rate(self):
-        prep = self.meal_set.filter(meal_prep='cook').aggregate(
-            rate=Avg(
-                Case(
-                    When(course__prepared=False, then=0),
-                    When(course__prepared=True, then=1),
-                    output_field=IntegerField()
-                )
-            )
-        )
-        return int((prep['rate'] or 0) * 100)
+        stats = self.get_stats()
+        if not stats.cook_courses:
+            return 0
+        return stats.prepared_cook_courses * 100 // stats.cook_courses
 
     def eat_rate(self):
-        eat = self.meal_set.filter(meal_prep='cook')\
-        .aggregate(
-            rate=Avg(
-                Case(
-                When(course__eaten=False, then=0),
-                When(course__eaten=True, then=1),
-                output_field=IntegerField()
-                )
-            )
-        )
-        return int((eat['rate'] or 0) * 100)
+        stats = self.get_stats()
+        if not stats.cook_courses:
+            return 0
+        return stats.eaten_cook_courses * 100 // stats.cook_courses
 
     def plan_rate(self):
-        min_date = self.meal_set.aggregate(min_date=Min('date'))['min_date']
-        if not min_date:
+        """Meals of each type planned per 100 days since the first meal,
+        from the running totals, so upcoming meals count too.
+        stats.planning_coverage covers a chosen window, week by week."""
+        stats = self.get_stats()
+        if not stats.first_meal_date:
             days_planning = 1
         else:
-            days_planning = (date.today() - min_date).days
-        breakfasts = self.meal_set.filter(meal_type='breakfast').count()
-        lunches = self.meal_set.filter(meal_type='lunch').count()
-        dinners = self.meal_set.filter(meal_type='dinner').count()
-        snacks = self.meal_set.filter(meal_type='snack').count()
-        all_meals = breakfasts + lunches + dinners + snacks
-        planning = {}
-        planning['breakfasts'] = breakfasts*100/days_planning
-        planning['lunches'] = lunches*100/days_planning
-        planning['dinners'] = dinners*100/days_planning
-        planning['snacks'] = snacks*100/days_planning
-        planning['all'] = (breakfasts + lunches + dinners + snacks) * 100/(days_planning * 4)
+            days_planning = (date.today() - stats.first_meal_date).days or 1
+        counts = {'breakfasts': stats.breakfasts, 'lunches': stats.lunches,
+                  'dinners': stats.dinners, 'desserts': stats.desserts,
+                  'snacks': stats.snacks, 'tapas': stats.tapas}
+        planning = {name: count * 100 // days_planning for name, count in counts.items()}
+        planning['all'] = sum(counts.values()) * 100 // (days_planning * len(counts))
         return planning
 
 
@@ -132,6 +116,12 @@ class Tag(models.Model):
     name = models.CharField(max_length=48)
     color = models.CharField(max_length=48, default=randcolor)
 
+    # How many dishes, ingredients and meals have the tag, kept up to date
+    # by themenu.counts
+    dish_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    ingredient_count = models.PositiveIntegerField(default=0, editable=False)
+    meal_count = models.PositiveIntegerField(default=0, editable=False)
+
     def __str__(self):
         return self.name
 
@@ -147,6 +137,10 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=96, unique=True)
     tags = models.ManyToManyField(Tag, blank=True)
 
+    # How many dishes use any amount of the ingredient, kept up to date
+    # by themenu.counts
+    dish_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+
     def __unicode__(self):
         return self.name
 
@@ -154,12 +148,33 @@ class Ingredient(models.Model):
 class IngredientAmount(models.Model):
     """An ingredient tied to a specific amount
 
-    Used in both the recipe display and grocery list"""
+    Used in both the recipe display and grocery list. There is one per
+    ingredient and amount text, shared by every dish using it (see
+    themenu.amounts)"""
+    class Meta:
+        unique_together = ('ingredient', 'amount')
+
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
 
     # This can be anything from "1 2/3 lb" to "1 medium" (for a tomato)
     amount = models.CharField(max_length=256, blank=True, default='')
 
+    # The amount as a number, filled in from the text on save (see quantities.py)
+    # "1 2/3 lb" is 756 "g", "1 medium" is 1 "" with the descriptor "medium"
+    quantity = models.FloatField(null=True, blank=True, editable=False)
+    unit = models.CharField(max_length=16, blank=True, default='', editable=False)
+    descriptor = models.CharField(max_length=256, blank=True, default='', editable=False)
+
+    def parse_amount(self):
+        """Tidy up the amount text and fill in quantity, unit and
+        descriptor from it"""
+        self.amount = normalize_amount(self.amount)
+        self.quantity, self.unit, self.descriptor = parse_amount(self.amount)
+
+    def save(self, *args, **kwargs):
+        self.parse_amount()
+        super(IngredientAmount, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return '%s: %s' % (self.ingredient.name, self.amount) if self.amount \
                 else '%s' % self.ingredient.name
@@ -180,9 +195,29 @@ class Dish(models.Model):
     ingredient_amounts = models.ManyToManyField(IngredientAmount, blank=True)
     tags = models.ManyToManyField(Tag, blank=True)
 
+    # Kept up to date by themenu.search, see update_dish_search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Copies of the dish's review scores, see update_review_scores
+    review_count = models.IntegerField(default=0, editable=False)
+    avg_fastness = models.FloatField(null=True, editable=False, db_index=True)
+    avg_ease = models.FloatField(null=True, editable=False, db_index=True)
+    avg_results = models.FloatField(null=True, editable=False, db_index=True)
+
     def get_absolute_url(self):
         return reverse('dish-detail', args=[str(self.id)])
 
+    def update_review_scores(self):
+        """Work out the review count and average scores again
+        Called whenever one of the dish's reviews is saved or deleted"""
+        scores = self.dishreview_set.aggregate(review_count=Count('id'),
+                                               avg_fastness=Avg('fastness'),
+                                               avg_ease=Avg('ease'),
+                                               avg_results=Avg('results'))
+        Dish.objects.filter(id=self.id).update(**scores)
+        for field, value in scores.items():
+            setattr(self, field, value)
+
     def __unicode__(self):
         return self.name
 
@@ -190,7 +225,9 @@ class Dish(models.Model):
 class Meal(models.Model):
     """A collection of dishes to be eaten at one time"""
     class Meta:
-        unique_together = ('date', 'meal_type', 'team')
+        # Team first, so the same index serves the calendar's date ranges
+        unique_together = ('team', 'date', 'meal_type')
+        index_together = [('team', 'meal_prep', 'date')]
         ordering = ['date']
 
     MEAL_TYPE_CHOICES = [
@@ -215,6 +252,21 @@ class Meal(models.Model):
     date = models.DateField('meal date')
     team = models.ForeignKey(Team)
 
+    # Goes up whenever the meal, its courses or its tags change,
+    # so its cached calendar cell can be told apart from the new one
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    def save(self, *args, **kwargs):
+        """The version is only moved forward in the database (see
+        themenu.plans.bump_meal_versions), so saving a meal loaded before a
+        bump leaves it alone rather than writing the old number back. Meals
+        not loaded from the database, even with a pk given, save as usual."""
+        if not self._state.adding and not kwargs.get('update_fields') \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'version']
+        super(Meal, self).save(*args, **kwargs)
+
     def weeknum(self):
         _, weeknum, = self.date.isocalendar()
         return weeknum
@@ -249,17 +301,30 @@ class Course(models.Model):
 
 class GroceryListItem(models.Model):
     """An item to buy, automatically populated from a new meal"""
+    class Meta:
+        index_together = [('team', 'meal_date')]
+
     ingredient_amount = models.ForeignKey(IngredientAmount, default=None, null=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, null=True)
     purchased = models.BooleanField(default=False)
 
+    # Copies of the course's meal's team and date and the amount's
+    # ingredient, so the grocery list is read without joining through
+    # courses and meals (see themenu.groceries)
+    team = models.ForeignKey(Team, null=True, editable=False)
+    meal_date = models.DateField(null=True, editable=False)
+    ingredient = models.ForeignKey(Ingredient, null=True, editable=False)
+
     def __unicode__(self):
         return 'IngredientAmount: %s, Purchased: %s' % \
             (self.ingredient_amount, self.purchased)
 
 
 class RandomGroceryItem(models.Model):
-    """For things like paper towels, random snacks..."""
+    """For things like paper towels, random snacks...
+
+    The ones not purchased yet have a partial index on team (see
+    migration 0039)"""
     name = models.TextField()
     team = models.ForeignKey(Team)
     purchased = models.BooleanField(default=False)
@@ -288,3 +353,46 @@ class DishReview(models.Model):
     results = models.IntegerField(choices=RESULTS_CHOICES, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, blank=True)
+
+
+class TeamStats(models.Model):
+    """Running totals behind a team's stats page, so it doesn't have to
+    go through the team's whole history. Kept up to date by themenu.stats"""
+    class Meta:
+        verbose_name_plural = "team stats"
+
+    team = models.OneToOneField(Team, primary_key=True, related_name='stats')
+    first_meal_date = models.DateField(null=True, blank=True)
+
+    # Meals planned of each type
+    breakfasts = models.IntegerField(default=0)
+    lunches = models.IntegerField(default=0)
+    dinners = models.IntegerField(default=0)
+    desserts = models.IntegerField(default=0)
+    snacks = models.IntegerField(default=0)
+    tapas = models.IntegerField(default=0)
+
+    # Courses of meals to cook, and how many of those got made and eaten
+    cook_courses = models.IntegerField(default=0)
+    prepared_cook_courses = models.IntegerField(default=0)
+    eaten_cook_courses = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return 'Stats for team %s' % self.team_id
+
+
+class TeamDishStats(models.Model):
+    """How often a team has planned, cooked and eaten a dish"""
+    class Meta:
+        unique_together = ('team', 'dish')
+        verbose_name_plural = "team dish stats"
+
+    team = models.ForeignKey(Team, on_delete=models.CASCADE)
+    dish = models.ForeignKey(Dish, on_delete=models.CASCADE)
+    planned = models.IntegerField(default=0)
+    cooked = models.IntegerField(default=0)
+    eaten = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return 'Team %s, Dish %s: planned %s, cooked %s, eaten %s' % \
+            (self.team_id, self.dish_id, self.planned, self.cooked, self.eaten)
@@ -0,0 +1,170 @@
+"""Loading a team's planned meals for the calendar, and saving the
+checkboxes clicked on it
+
+Everything in a date range is fetched up front (meals, then their
+courses, dishes and tags in one prefetch each) and arranged in memory,
+so the number of queries doesn't depend on how many cells the calendar has.
+Long ranges are loaded a few weeks at a time to keep each query bounded."""
+from collections import defaultdict, OrderedDict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Prefetch, Q
+
+from themenu.caching import bump_version, team_scope
+from themenu.conditional import touch_team
+from themenu.groceries import mark_course_groceries_purchased
+from themenu.models import Meal, Course
+from themenu.stats import load_meal_states, record_meal_changes
+
+# The longest span the calendar will show or serve as json at once
+MAX_RANGE_WEEKS = 26
+
+# How many days of meals are loaded per round of queries
+CHUNK_DAYS = 28
+
+
+def meal_types():
+    return [i[1] for i in Meal.MEAL_TYPE_CHOICES]
+
+
+def team_meals(team, start, end):
+    """All meals for a team from start to end (inclusive), with the
+    courses, dishes and tags the calendar cells need already loaded"""
+    return Meal.objects.filter(team=team, date__range=(start, end))\
+                       .prefetch_related(
+                           Prefetch('course_set',
+                                    queryset=Course.objects.select_related('dish')),
+                           'tags')
+
+
+def iter_team_meals(team, start, end, chunk_days=CHUNK_DAYS):
+    """Like team_meals, but loads the range chunk_days at a time"""
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        for meal in team_meals(team, chunk_start, chunk_end):
+            yield meal
+        chunk_start = chunk_end + timedelta(days=1)
+
+
+def week_days(monday):
+    return [monday + timedelta(days=i) for i in range(7)]
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def week_range(start, end):
+    """Stretch start back to its Monday and end out to its Sunday,
+    keeping the span to at most MAX_RANGE_WEEKS"""
+    monday = week_start(start)
+    sunday = week_start(end) + timedelta(days=6)
+    return monday, min(sunday, monday + timedelta(weeks=MAX_RANGE_WEEKS, days=-1))
+
+
+def build_weekplan(days, meal_lookup):
+    """Arrange meals into the calendar grid
+
+    Returns an OrderedDict of meal type -> list of
+    {'date': date, 'daymeal': Meal or None}, one per day"""
+    weekplan = OrderedDict()
+    for type_ in meal_types():
+        weekplan[type_] = [{'date': day,
+                            'daymeal': meal_lookup.get((type_, day))}
+                           for day in days]
+    return weekplan
+
+
+def load_range_plan(team, start, end):
+    """Build one calendar grid per week from start to end
+
+    The range should already be whole weeks (see week_range).
+    Returns a list of {'monday': date, 'weekplan': OrderedDict}"""
+    meal_lookup = {(meal.meal_type, meal.date): meal
+                   for meal in iter_team_meals(team, start, end)}
+    weeks = []
+    monday = start
+    while monday <= end:
+        weeks.append({'monday': monday,
+                      'weekplan': build_weekplan(week_days(monday), meal_lookup)})
+        monday += timedelta(weeks=1)
+    return weeks
+
+
+def meal_as_dict(meal):
+    """The json form of a meal loaded by team_meals"""
+    return {
+        'id': meal.id,
+        'meal_type': meal.meal_type,
+        'meal_prep': meal.meal_prep,
+        'tags': [{'id': t.id, 'name': t.name, 'color': t.color}
+                 for t in meal.tags.all()],
+        'courses': [{'dish_id': c.dish_id,
+                     'dish_name': c.dish.name,
+                     'prepared': c.prepared,
+                     'eaten': c.eaten}
+                    for c in meal.course_set.all()],
+    }
+
+
+def range_plan_as_dicts(team, start, end):
+    """The meals from start to end as a list of days for the json api"""
+    meals_by_day = OrderedDict()
+    day = start
+    while day <= end:
+        meals_by_day[day] = []
+        day += timedelta(days=1)
+    for meal in iter_team_meals(team, start, end):
+        meals_by_day[meal.date].append(meal_as_dict(meal))
+    return [{'date': day.isoformat(), 'meals': meals}
+            for day, meals in meals_by_day.items()]
+
+
+def bump_meal_versions(meal_ids):
+    """Mark these meals' calendar cells as changed, in one UPDATE"""
+    Meal.objects.filter(id__in=meal_ids).update(version=F('version') + 1)
+
+
+def set_course_flags(team, updates):
+    """Save many prepared/eaten checkbox clicks at once
+
+    updates is a list of (meal id, dish id, attribute, value) in the order
+    they were clicked, and the last click on a checkbox wins. Courses
+    getting the same change are written with one UPDATE, then their
+    groceries are marked purchased, as saving a single course would do,
+    and the team's stats, cached pages and cells and modified time are
+    brought up to date.
+    Returns the number of courses changed. Raises ValueError when there is
+    no team."""
+    if team is None:
+        raise ValueError('No team')
+    latest = OrderedDict()
+    for meal_id, dish_id, attribute, value in updates:
+        latest[(meal_id, dish_id, attribute)] = value
+    if not latest:
+        return 0
+
+    changes = defaultdict(list)
+    for (meal_id, dish_id, attribute), value in latest.items():
+        changes[(attribute, value)].append(Q(meal_id=meal_id, dish_id=dish_id))
+
+    team_courses = Course.objects.filter(meal__team=team)
+    meal_ids = set(meal_id for meal_id, _, _ in latest)
+    changed = 0
+    with transaction.atomic():
+        before = load_meal_states(meal_ids)
+        for (attribute, value), matches in changes.items():
+            changed += team_courses.filter(reduce(or_, matches)).update(**{attribute: value})
+        clicked = reduce(or_, (Q(meal_id=meal_id, dish_id=dish_id)
+                               for meal_id, dish_id, _ in latest))
+        mark_course_groceries_purchased(team_courses.filter(clicked))
+        if changed:
+            record_meal_changes(before, load_meal_states(meal_ids))
+            bump_meal_versions(meal_ids)
+            bump_version(team_scope(team.id))
+            touch_team(team.id)
+    return changed
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""Reading amounts like "1 2/3 lb" or "1 medium" as numbers
+
+IngredientAmount.amount stays what the user typed, give or take spaces
+and capitals (see normalize_amount), but it is also split into a
+quantity, a canonical unit and whatever text is left over (the
+descriptor) when it is saved. Volumes are kept in milliliters and
+weights in grams, so the grocery list can add up "1 cup" and "2 tbsp"
+in the database and only format the total for display."""
+from __future__ import division, unicode_literals
+
+import re
+from fractions import Fraction
+
+# Each unit as it might be written -> (canonical unit, size in that unit)
+# Units that can't be converted to anything else are their own canonical unit
+UNITS = {}
+
+
+def _add_units(canonical, size, *names):
+    for name in names:
+        UNITS[name] = (canonical, size)
+
+
+_add_units('ml', 1, 'ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres')
+_add_units('ml', 1000, 'l', 'liter', 'liters', 'litre', 'litres')
+_add_units('ml', 4.92892, 'tsp', 'tsps', 'teaspoon', 'teaspoons')
+_add_units('ml', 14.7868, 'tbsp', 'tbsps', 'tbs', 'tbl', 'tablespoon', 'tablespoons')
+_add_units('ml', 29.5735, 'fl oz', 'fluid ounce', 'fluid ounces')
+_add_units('ml', 118.294, 'gill', 'gills')
+_add_units('ml', 236.588, 'c', 'cup', 'cups')
+_add_units('ml', 473.176, 'pt', 'pint', 'pints')
+_add_units('ml', 946.353, 'qt', 'quart', 'quarts')
+_add_units('ml', 3785.41, 'gal', 'gallon', 'gallons')
+_add_units('g', 0.001, 'mg', 'milligram', 'milligrams')
+_add_units('g', 1, 'g', 'gram', 'grams')
+_add_units('g', 1000, 'kg', 'kilogram', 'kilograms')
+_add_units('g', 28.3495, 'oz', 'ounce', 'ounces')
+_add_units('g', 453.592, 'lb', 'lbs', 'pound', 'pounds')
+_add_units('dash', 1, 'dash', 'dashes')
+_add_units('pinch', 1, 'pinch', 'pinches')
+_add_units('clove', 1, 'clove', 'cloves')
+_add_units('can', 1, 'can', 'cans')
+_add_units('stick', 1, 'stick', 'sticks')
+_add_units('strip', 1, 'strip', 'strips')
+_add_units('slice', 1, 'slice', 'slices')
+_add_units('bunch', 1, 'bunch', 'bunches')
+_add_units('head', 1, 'head', 'heads')
+_add_units('package', 1, 'package', 'packages', 'pkg')
+_add_units('inch', 1, 'inch', 'inches')
+
+# How totals in the canonical units are shown, largest first
+DISPLAY_UNITS = {
+    'ml': [('cup', 236.588, 0.25), ('tbsp', 14.7868, 1), ('tsp', 4.92892, 0)],
+    'g': [('lb', 453.592, 1), ('oz', 28.3495, 0)],
+}
+
+VULGAR_FRACTIONS = {
+    '¼': Fraction(1, 4), '½': Fraction(1, 2), '¾': Fraction(3, 4),
+    '⅓': Fraction(1, 3), '⅔': Fraction(2, 3), '⅛': Fraction(1, 8),
+}
+
+_NUMBER = (r'(?:\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)[{vulgar}]?|[{vulgar}]'
+           .format(vulgar=''.join(VULGAR_FRACTIONS)))
+
+AMOUNT_RE = re.compile(
+    r'^\s*(?P<quantity>{number})(?:\s*(?:-|to)\s*(?P<upto>{number}))?\s*(?P<rest>.*)$'
+    .format(number=_NUMBER), re.UNICODE)
+
+# A unit ends at a space, the end, or punctuation like the comma in
+# "1 cup, chopped", which is left out of the descriptor
+UNIT_RE = re.compile(
+    r'^(?P<unit>{units})\.?(?=[\s,;)]|$)[\s,;]*(?P<rest>.*)$'
+    .format(units='|'.join(re.escape(u) for u in sorted(UNITS, key=len, reverse=True))),
+    re.UNICODE)
+
+
+def parse_number(text):
+    """'1 1/2', '1.5', '3/2' and '1½' are all 1.5"""
+    text = text.strip()
+    total = Fraction(0)
+    if text and text[-1] in VULGAR_FRACTIONS:
+        total += VULGAR_FRACTIONS[text[-1]]
+        text = text[:-1]
+    for part in text.split():
+        if '/' in part:
+            numerator, denominator = part.split('/')
+            if int(denominator) == 0:
+                raise ValueError('Zero denominator in %s' % part)
+            total += Fraction(int(numerator), int(denominator))
+        else:
+            total += Fraction(part)
+    return float(total)
+
+
+def normalize_amount(amount):
+    """An amount with its whitespace collapsed and in lower case, so
+    "1  Cup" and "1 cup" are stored as the same IngredientAmount"""
+    return ' '.join((amount or '').split()).lower()
+
+
+def parse_amount(amount):
+    """Split an amount into (quantity, canonical unit, descriptor)
+
+    The quantity is a float in the canonical unit, or None if the amount
+    doesn't start with a number. The unit is '' for plain counts like
+    "1 medium", where the descriptor says what is being counted.
+    For ranges like "2-3 cloves" the larger number is used."""
+    amount = normalize_amount(amount)
+    match = AMOUNT_RE.match(amount)
+    if not match:
+        return None, '', amount
+    try:
+        quantity = parse_number(match.group('upto') or match.group('quantity'))
+    except ValueError:
+        return None, '', amount
+
+    rest = match.group('rest')
+    unit_match = UNIT_RE.match(rest)
+    if not unit_match:
+        return quantity, '', rest
+    unit, size = UNITS[unit_match.group('unit')]
+    return quantity * size, unit, unit_match.group('rest')
+
+
+def format_number(number):
+    """Numbers close to a half, third, quarter or eighth are shown as
+    fractions, like 1 1/2, anything else as a short decimal"""
+    for denominator in (1, 2, 3, 4, 8):
+        fraction = Fraction(int(round(number * denominator)), denominator)
+        if fraction and abs(float(fraction) - number) / number <= 0.02:
+            break
+    else:
+        return '{:g}'.format(round(number, 2))
+    whole, part = divmod(fraction, 1)
+    if not part:
+        return '%d' % whole
+    if not whole:
+        return '%s' % part
+    return '%d %s' % (whole, part)
+
+
+def format_quantity(quantity, unit, descriptor=''):
+    """Show a total from the database in a unit a shopper would use"""
+    for name, size, minimum in DISPLAY_UNITS.get(unit, []):
+        if quantity / size >= minimum:
+            quantity, unit = quantity / size, name
+            break
+    return ' '.join(part for part in (format_number(quantity), unit, descriptor) if part)
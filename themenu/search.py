@@ -0,0 +1,98 @@
+"""Full-text search over the dish catalogue
+
+Each dish keeps a tsvector of its name, tag names, ingredient names,
+notes and recipe in Dish.search_vector, weighted in that order so a match
+on the name ranks above one buried in the recipe. The column has a GIN
+index, so a search only looks at dishes that contain the words.
+
+The vector is rebuilt in the database for just the dishes that changed
+whenever a dish, its tags or ingredients are saved (see signals.py)."""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F
+
+from themenu.models import Dish, Ingredient, IngredientAmount, Tag
+
+SEARCH_CONFIG = 'english'
+
+# Rebuilds search_vector for the dishes whose ids are passed in as an array
+UPDATE_SEARCH_SQL = """
+UPDATE themenu_dish SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(themenu_dish.name, '')), 'A') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(themenu_tag.name, ' ')
+        FROM themenu_tag
+        JOIN themenu_dish_tags ON themenu_dish_tags.tag_id = themenu_tag.id
+        WHERE themenu_dish_tags.dish_id = themenu_dish.id), '')), 'B') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(themenu_ingredient.name, ' ')
+        FROM themenu_ingredient
+        JOIN themenu_ingredientamount
+            ON themenu_ingredientamount.ingredient_id = themenu_ingredient.id
+        JOIN themenu_dish_ingredient_amounts
+            ON themenu_dish_ingredient_amounts.ingredientamount_id = themenu_ingredientamount.id
+        WHERE themenu_dish_ingredient_amounts.dish_id = themenu_dish.id), '')), 'B') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(themenu_dish.notes, '')), 'C') ||
+    setweight(to_tsvector(%(config)s::regconfig, coalesce(themenu_dish.recipe, '')), 'D')
+WHERE themenu_dish.id = ANY(%(dish_ids)s)
+"""
+
+
+def update_dish_search(dish_ids):
+    """Rebuild the search vector of these dishes in one UPDATE"""
+    dish_ids = list(set(dish_ids))
+    if not dish_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(UPDATE_SEARCH_SQL, {'config': SEARCH_CONFIG, 'dish_ids': dish_ids})
+
+
+def dishes_mentioning(instance):
+    """The dishes whose search vector includes this tag's, ingredient's or
+    ingredient amount's name"""
+    if isinstance(instance, Tag):
+        return Dish.objects.filter(tags=instance)
+    if isinstance(instance, Ingredient):
+        return Dish.objects.filter(ingredient_amounts__ingredient=instance)
+    if isinstance(instance, IngredientAmount):
+        return Dish.objects.filter(ingredient_amounts=instance)
+    raise TypeError('No dishes mention a %s' % type(instance).__name__)
+
+
+def rebuild_search_index(batch_size=1000):
+    """Rebuild the search vector of every dish, batch_size at a time
+    Returns the number of dishes updated"""
+    dish_ids = list(Dish.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(dish_ids), batch_size):
+        update_dish_search(dish_ids[start:start + batch_size])
+    return len(dish_ids)
+
+
+class PrefixSearchQuery(SearchQuery):
+    """Matches dishes with every word of the search, where each word may
+    just be the start of one, so "chick" finds "chicken" while typing
+
+    Only the letters and digits of the search make it into the tsquery,
+    so nothing typed can be read as tsquery syntax."""
+
+    def __init__(self, text, **extra):
+        words = re.findall(r'\w+', text, re.UNICODE)
+        super(PrefixSearchQuery, self).__init__(' & '.join(w + ':*' for w in words), **extra)
+
+    def as_sql(self, compiler, connection):
+        config_sql, config_params = compiler.compile(self.config)
+        return 'to_tsquery({}::regconfig, %s)'.format(config_sql), config_params + [self.value]
+
+
+def search_dishes(text):
+    """Dishes matching the words in text, best match first
+
+    A search with no words matches every dish, in name order."""
+    if not re.search(r'\w', text, re.UNICODE):
+        return Dish.objects.order_by('name')
+    query = PrefixSearchQuery(text, config=SEARCH_CONFIG)
+    return Dish.objects.filter(search_vector=query)\
+                       .annotate(rank=SearchRank(F('search_vector'), query))\
+                       .order_by('-rank', 'name', 'id')
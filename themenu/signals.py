@@ -1,57 +1,226 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 
 from django.dispatch import receiver
 
-from .models import Course, GroceryListItem, MyUser
-
-
-def get_course_ingredient_amounts(course):
-    return (ingredient_amount for ingredient_amount
-            in course.dish.ingredient_amounts.all())
-
-
-def get_course_groceries(course):
-    ingredient_ids = [ing_amt.id for ing_amt in get_course_ingredient_amounts(course)]
-    return GroceryListItem.objects.filter(course=course, ingredient_amount__in=ingredient_ids)
+from .caching import CATALOG, bump_version, team_scope
+from .conditional import touch_team
+from .counts import recount_amount_ingredients, recount_ingredients, recount_tags
+from .groceries import (
+    copy_ingredient_to_groceries,
+    copy_meal_to_groceries,
+    mark_course_groceries_purchased,
+    sync_course_groceries,
+)
+from .models import (
+    Course, Dish, DishReview, Ingredient, IngredientAmount, Meal, MyUser, RandomGroceryItem, Tag,
+)
+from .plans import bump_meal_versions
+from .search import dishes_mentioning, update_dish_search
 
 
 @receiver(post_save, sender=Course)
 def notify_course_post_save(sender, **kwargs):
     course = kwargs['instance']
     update_fields = kwargs['update_fields'] or ''
-    # Only create groceries for "cook" type meals
-    if course.meal.meal_prep == 'leftover':
+
+    if 'eaten' in update_fields or 'prepared' in update_fields:
+        mark_course_groceries_purchased([course])
         return
 
-    if kwargs['created'] is True:
-        # Make new ones
-        for ing_amt in get_course_ingredient_amounts(course):
-            try:
-                GroceryListItem.objects.get(course=course, ingredient_amount=ing_amt)
-            except GroceryListItem.DoesNotExist:
-                GroceryListItem(course=course, ingredient_amount=ing_amt).save()
-    else:
-        if 'eaten' in update_fields or 'prepared' in update_fields:
-            get_course_groceries(course).update(purchased=True)
-            return
-
-        # Delete the grocery items for this course
-        new_grocery_id_list = []
-        for ing_amt in get_course_ingredient_amounts(course):
-            try:
-                GroceryListItem.objects.get(course=course, ingredient_amount=ing_amt)
-            except GroceryListItem.DoesNotExist:
-                g = GroceryListItem(course=course, ingredient_amount=ing_amt)
-                g.save()
-                # Keep track of the ones we just added
-                new_grocery_id_list.append(g.id)
-        groceries_to_delete = GroceryListItem.objects.filter(course=course, purchased=False).exclude(id__in=new_grocery_id_list)
-
-        groceries_to_delete.delete()
+    sync_course_groceries([course])
+
+
+@receiver(post_save, sender=Meal)
+def update_meal_groceries(sender, instance, created, **kwargs):
+    if not created:
+        copy_meal_to_groceries(instance)
+
+
+@receiver(post_save, sender=IngredientAmount)
+def update_ingredient_amount_groceries(sender, instance, created, **kwargs):
+    if not created:
+        copy_ingredient_to_groceries(instance)
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def add_myuser(sender, instance, created, **kwargs):
     if created:
         MyUser.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Dish)
+def update_dish_search_on_save(sender, instance, **kwargs):
+    update_dish_search([instance.id])
+
+
+@receiver(m2m_changed, sender=Dish.tags.through)
+@receiver(m2m_changed, sender=Dish.ingredient_amounts.through)
+def update_dish_search_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            update_dish_search([instance.id])
+        return
+
+    # Changed from the tag or ingredient amount side, so pk_set holds dish ids
+    if action == 'pre_clear':
+        instance._search_dish_ids = list(instance.dish_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        update_dish_search(instance._search_dish_ids)
+    elif action in ('post_add', 'post_remove'):
+        update_dish_search(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=IngredientAmount)
+def update_dish_search_on_rename(sender, instance, created, **kwargs):
+    if not created:
+        update_dish_search(dishes_mentioning(instance).values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_dishes_to_search(sender, instance, **kwargs):
+    instance._search_dish_ids = list(dishes_mentioning(instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_dish_search_on_delete(sender, instance, **kwargs):
+    update_dish_search(instance._search_dish_ids)
+
+
+@receiver(post_save, sender=DishReview)
+@receiver(post_delete, sender=DishReview)
+def update_dish_review_scores(sender, instance, **kwargs):
+    instance.dish.update_review_scores()
+
+
+@receiver([post_save, post_delete], sender=Dish)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=IngredientAmount)
+@receiver([post_save, post_delete], sender=DishReview)
+@receiver(m2m_changed, sender=Dish.tags.through)
+@receiver(m2m_changed, sender=Dish.ingredient_amounts.through)
+@receiver(m2m_changed, sender=Ingredient.tags.through)
+def bump_catalog_version(sender, **kwargs):
+    bump_version(CATALOG)
+
+
+@receiver([post_save, post_delete], sender=Meal)
+def mark_meal_team_changed(sender, instance, **kwargs):
+    bump_version(team_scope(instance.team_id))
+    touch_team(instance.team_id)
+
+
+@receiver([post_save, post_delete], sender=Course)
+def mark_course_team_changed(sender, instance, **kwargs):
+    # Removed along with others by save_meal_courses, which does this once
+    if getattr(instance, '_changed_with_meal', False):
+        return
+    team_id = instance.meal.team_id
+    bump_version(team_scope(team_id))
+    touch_team(team_id)
+
+
+@receiver([post_save, post_delete], sender=RandomGroceryItem)
+def mark_random_grocery_team_changed(sender, instance, **kwargs):
+    touch_team(instance.team_id)
+
+
+@receiver(post_save, sender=Meal)
+def bump_meal_version(sender, instance, created, **kwargs):
+    # However the meal was saved (a view, the admin, the shell)
+    if not created:
+        bump_meal_versions([instance.id])
+
+
+@receiver([post_save, post_delete], sender=Course)
+def bump_course_meal_version(sender, instance, **kwargs):
+    if getattr(instance, '_changed_with_meal', False):
+        return
+    bump_meal_versions([instance.meal_id])
+
+
+@receiver(m2m_changed, sender=Meal.tags.through)
+def bump_meal_tags_version(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_meal_versions([instance.id])
+        return
+
+    # Changed from the tag's side, so pk_set holds meal ids, except on a
+    # clear, when they have to be found before the rows go
+    if action == 'pre_clear':
+        instance._bump_meal_ids = list(instance.meal_set.values_list('id', flat=True))
+    elif action == 'post_clear':
+        bump_meal_versions(instance._bump_meal_ids)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        bump_meal_versions(pk_set)
+
+
+@receiver(m2m_changed, sender=Dish.tags.through)
+@receiver(m2m_changed, sender=Ingredient.tags.through)
+@receiver(m2m_changed, sender=Meal.tags.through)
+def update_tag_counts_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # Changed from the tag's side, so only its own count can change
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recount_tags(sender, [instance.id])
+        return
+
+    if action == 'pre_clear':
+        instance._count_tag_ids = list(instance.tags.values_list('id', flat=True))
+    elif action == 'post_clear':
+        recount_tags(sender, instance._count_tag_ids)
+    elif action in ('post_add', 'post_remove'):
+        recount_tags(sender, pk_set)
+
+
+@receiver(pre_delete, sender=Dish)
+@receiver(pre_delete, sender=Ingredient)
+@receiver(pre_delete, sender=Meal)
+def remember_tags_to_count(sender, instance, **kwargs):
+    # The delete takes the m2m rows with it without sending m2m_changed
+    instance._count_tag_ids = list(instance.tags.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Dish)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Meal)
+def update_tag_counts_on_delete(sender, instance, **kwargs):
+    recount_tags(sender.tags.through, instance._count_tag_ids)
+
+
+@receiver(m2m_changed, sender=Dish.ingredient_amounts.through)
+def update_ingredient_counts_on_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # Changed from the ingredient amount's side
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recount_ingredients([instance.ingredient_id])
+        return
+
+    if action == 'pre_clear':
+        instance._count_amount_ids = list(instance.ingredient_amounts.values_list('id', flat=True))
+    elif action == 'post_clear':
+        recount_amount_ingredients(instance._count_amount_ids)
+    elif action in ('post_add', 'post_remove'):
+        recount_amount_ingredients(pk_set)
+
+
+@receiver(pre_delete, sender=Dish)
+def remember_ingredients_to_count(sender, instance, **kwargs):
+    instance._count_ingredient_ids = list(
+        instance.ingredient_amounts.values_list('ingredient_id', flat=True))
+
+
+@receiver(post_delete, sender=Dish)
+def update_ingredient_counts_on_dish_delete(sender, instance, **kwargs):
+    recount_ingredients(instance._count_ingredient_ids)
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def update_ingredient_counts_on_amount_delete(sender, instance, **kwargs):
+    recount_ingredients([instance.ingredient_id])
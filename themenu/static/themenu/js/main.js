@@ -27,7 +27,7 @@ $(document).ready(function() {
     var groceryType = $(this).data('grocery-type');
     var checked = this.checked;
     console.log('clicked', groceryId, checked);
-    postGroceryUpdate(groceryId, groceryType, checked)
+    queueGroceryUpdate(groceryId, groceryType, checked)
   });
 
   $('.course-checkbox').on('click touch', function() {
@@ -36,7 +36,17 @@ $(document).ready(function() {
     var attribute = $(this).data('attribute');
     var checked = this.checked;
     console.log('clicked', dishId, mealId, attribute, checked);
-    postCourseUpdate(dishId, mealId, attribute, checked)
+    queueCourseUpdate(dishId, mealId, attribute, checked)
+  });
+
+  // Send any clicks still waiting in the queue before the page goes away
+  $(window).on('pagehide', function() {
+    flushUpdates(true);
+  });
+  $(document).on('visibilitychange', function() {
+    if (document.visibilityState == 'hidden') {
+      flushUpdates(true);
+    }
   });
 
   $('#add-ingredient').on('click touch', function(event) {
@@ -104,7 +114,7 @@ $(document).ready(function() {
         var groceryType = $widget.data('grocery-type');
         var checked = $checkbox.prop('checked');
         console.log('clicked', groceryId, checked);
-        postGroceryUpdate(groceryId, groceryType, checked)
+        queueGroceryUpdate(groceryId, groceryType, checked)
       }
     });
     $checkbox.on('change', function () {
@@ -199,21 +209,115 @@ function getCookie(name) {
   return cookieValue;
 }
 
-function postGroceryUpdate(groceryId, groceryType, checked) {
+// Checkbox clicks are queued and sent together once the clicking stops for
+// a moment, so ticking off a whole shopping trip is a handful of requests.
+// Clicking the same checkbox again replaces its queued change.
+// When the server can't be reached the wait doubles after every failed
+// batch, up to a minute, and after a few failures in a row the changes
+// are given up on rather than retried forever from every open tab.
+var SYNC_DELAY_MS = 800;
+var SYNC_MAX_DELAY_MS = 60 * 1000;
+var SYNC_MAX_FAILURES = 6;
+var pendingUpdates = {
+  '/courseupdate/': {},
+  '/groceryupdate/': {}
+};
+var syncTimer = null;
+var syncFailures = 0;
+
+function queueCourseUpdate(dishId, mealId, attribute, checked) {
+  var key = [mealId, dishId, attribute].join(':');
+  pendingUpdates['/courseupdate/'][key] = {
+    dishId: dishId,
+    mealId: mealId,
+    attribute: attribute,
+    checked: checked
+  };
+  scheduleSync();
+}
+
+function queueGroceryUpdate(groceryId, groceryType, checked) {
+  var key = groceryType + ':' + groceryId;
+  pendingUpdates['/groceryupdate/'][key] = {
+    groceryId: groceryId,
+    groceryType: groceryType,
+    checked: checked
+  };
+  scheduleSync();
+}
+
+function syncDelay() {
+  if (syncFailures == 0) {
+    return SYNC_DELAY_MS;
+  }
+  var backoff = Math.min(SYNC_DELAY_MS * Math.pow(2, syncFailures), SYNC_MAX_DELAY_MS);
+  // Spread out the tabs that failed together so they don't retry together
+  return backoff / 2 + Math.random() * backoff / 2;
+}
+
+function scheduleSync() {
+  clearTimeout(syncTimer);
+  syncTimer = setTimeout(flushUpdates, syncDelay());
+}
+
+// leaving: the page is closing, so use a request the browser finishes anyway
+function flushUpdates(leaving) {
+  clearTimeout(syncTimer);
+  syncTimer = null;
+  $.each(pendingUpdates, function(url, queued) {
+    var updates = $.map(queued, function(update) { return update; });
+    if (updates.length == 0) {
+      return;
+    }
+    pendingUpdates[url] = {};
+    if (leaving === true && window.fetch) {
+      fetch(url, {
+        method: 'POST',
+        keepalive: true,
+        credentials: 'same-origin',
+        headers: {
+          'Content-Type': 'application/json',
+          'X-CSRFToken': getCookie('csrftoken')
+        },
+        body: JSON.stringify({updates: updates})
+      });
+      return;
+    }
+    postUpdates(url, queued, updates);
+  });
+}
+
+function postUpdates(url, queued, updates) {
   var $posting = $.ajax({
       type: 'POST',
-      url: '/groceryupdate/',
+      url: url,
       contentType: 'application/json',
       dataType: 'json',
-      data: JSON.stringify({
-        groceryId: groceryId,
-        groceryType: groceryType,
-        checked: checked
-      })
+      data: JSON.stringify({updates: updates})
   });
   $posting.done(function(data) {
-    console.log('Finished grocery ID', groceryId);
-    // window.location.reload();
+    syncFailures = 0;
+    console.log('Finished posting', updates.length, 'updates to', url, data);
+  });
+  $posting.fail(function(xhr) {
+    if (xhr.status >= 400 && xhr.status < 500) {
+      console.log('Rejected updates to', url, updates);
+      return;
+    }
+    syncFailures += 1;
+    if (syncFailures > SYNC_MAX_FAILURES) {
+      console.log('Giving up on updates to', url, updates);
+      syncFailures = 0;
+      alert('Your last changes could not be saved. Please reload the page and try again.');
+      return;
+    }
+    // Try again with the next batch, unless the checkbox was clicked since
+    $.each(queued, function(key, update) {
+      if (!(key in pendingUpdates[url])) {
+        pendingUpdates[url][key] = update;
+      }
+    });
+    scheduleSync();
   });
 }
 
@@ -239,25 +343,6 @@ function appendApiData(data, jqueryElement) {
 }
 
 
-function postCourseUpdate(dishId, mealId, attribute, checked) {
-  var $posting = $.ajax({
-      type: 'POST',
-      url: '/courseupdate/',
-      contentType: 'application/json',
-      dataType: 'json',
-      data: JSON.stringify({
-        dishId: dishId,
-        mealId: mealId,
-        attribute: attribute,
-        checked: checked
-      })
-  });
-  $posting.done(function(data) {
-    console.log('Finished posting dish ID', dishId, 'mealId', mealId);
-    // window.location.reload();
-  });
-}
-
 function csrfSafeMethod(method) {
   // these HTTP methods do not require CSRF protection
   return (/^(GET|HEAD|OPTIONS|TRACE)$/.test(method));
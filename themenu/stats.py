@@ -0,0 +1,285 @@
+"""Keeping each team's stats as running totals
+
+TeamStats and TeamDishStats hold counts that used to be aggregated over
+a team's whole history on every visit to its page. Whenever meals are
+saved, deleted or have their courses checked off, the meals are read
+before and after the change and the difference is added to the counts,
+so keeping them current costs a few small queries per write.
+
+Writes that don't go through the views (the admin, the shell) aren't
+counted; the rebuild_team_stats command works everything out again."""
+from collections import Counter, defaultdict, namedtuple, OrderedDict
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, DateField, F, Func, IntegerField, Min, Q, Sum, When
+from django.db.models.functions import Least
+
+from themenu.models import Course, Dish, Meal, Team, TeamDishStats, TeamStats
+
+MealState = namedtuple('MealState', ['team_id', 'meal_type', 'meal_prep', 'date', 'courses'])
+CourseState = namedtuple('CourseState', ['dish_id', 'prepared', 'eaten'])
+
+LEADERBOARD_METRICS = ('planned', 'cooked', 'eaten')
+
+# Meal type -> the TeamStats field counting meals of that type
+MEAL_TYPE_FIELDS = {
+    'breakfast': 'breakfasts',
+    'lunch': 'lunches',
+    'dinner': 'dinners',
+    'dessert': 'desserts',
+    'snack': 'snacks',
+    'tapas': 'tapas',
+}
+
+UPSERT_DISH_STATS_SQL = """
+INSERT INTO themenu_teamdishstats (team_id, dish_id, planned, cooked, eaten)
+VALUES {values}
+ON CONFLICT (team_id, dish_id) DO UPDATE SET
+    planned = themenu_teamdishstats.planned + EXCLUDED.planned,
+    cooked = themenu_teamdishstats.cooked + EXCLUDED.cooked,
+    eaten = themenu_teamdishstats.eaten + EXCLUDED.eaten
+"""
+
+# Only does anything when the team's first meal was on the date given
+RECHECK_FIRST_MEAL_SQL = """
+UPDATE themenu_teamstats
+SET first_meal_date = (SELECT MIN(date) FROM themenu_meal WHERE team_id = %(team_id)s)
+WHERE team_id = %(team_id)s AND first_meal_date = %(date)s
+"""
+
+
+def load_meal_states(meal_ids):
+    """What the stats need to know about these meals, in one query, as a
+    dict of meal id -> MealState. Meals that don't exist are left out."""
+    meal_ids = [meal_id for meal_id in meal_ids if meal_id is not None]
+    if not meal_ids:
+        return {}
+    rows = Meal.objects.filter(id__in=meal_ids)\
+                       .values_list('id', 'team_id', 'meal_type', 'meal_prep', 'date',
+                                    'course__dish_id', 'course__prepared', 'course__eaten')
+    states = {}
+    for meal_id, team_id, meal_type, meal_prep, date, dish_id, prepared, eaten in rows:
+        state = states.setdefault(meal_id, MealState(team_id, meal_type, meal_prep, date, []))
+        if dish_id is not None:
+            state.courses.append(CourseState(dish_id, prepared, eaten))
+    return states
+
+
+def add_meal_counts(state, sign, team_counts, dish_counts):
+    """Add (sign=1) or take away (sign=-1) a meal's share of the counts"""
+    if state.meal_type in MEAL_TYPE_FIELDS:
+        team_counts[MEAL_TYPE_FIELDS[state.meal_type]] += sign
+    cook = state.meal_prep == 'cook'
+    for course in state.courses:
+        counts = dish_counts[course.dish_id]
+        counts['planned'] += sign
+        if course.eaten:
+            counts['eaten'] += sign
+        if cook:
+            team_counts['cook_courses'] += sign
+            if course.prepared:
+                counts['cooked'] += sign
+                team_counts['prepared_cook_courses'] += sign
+            if course.eaten:
+                team_counts['eaten_cook_courses'] += sign
+
+
+def record_meal_changes(before, after):
+    """Update the stats for meals that went from the `before` states to
+    the `after` ones, both dicts as from load_meal_states
+
+    A meal only in `before` was deleted, one only in `after` was created."""
+    team_counts = defaultdict(Counter)
+    dish_counts = defaultdict(lambda: defaultdict(Counter))
+    first_dates = {}
+    vacated_dates = set()
+    for meal_id in set(before) | set(after):
+        old, new = before.get(meal_id), after.get(meal_id)
+        if old == new:
+            continue
+        if old:
+            add_meal_counts(old, -1, team_counts[old.team_id], dish_counts[old.team_id])
+            if not new or (new.team_id, new.date) != (old.team_id, old.date):
+                vacated_dates.add((old.team_id, old.date))
+        if new:
+            add_meal_counts(new, 1, team_counts[new.team_id], dish_counts[new.team_id])
+            first_dates[new.team_id] = min(new.date, first_dates.get(new.team_id, new.date))
+
+    with transaction.atomic():
+        for team_id in set(team_counts) | set(first_dates):
+            apply_team_counts(team_id, team_counts[team_id], dish_counts[team_id],
+                              first_dates.get(team_id))
+        with connection.cursor() as cursor:
+            for team_id, date in vacated_dates:
+                cursor.execute(RECHECK_FIRST_MEAL_SQL, {'team_id': team_id, 'date': date})
+
+
+def apply_team_counts(team_id, team_counts, dish_counts, first_date=None):
+    """Add the differences to one team's rows
+
+    If the team has no stats yet they're worked out from scratch instead,
+    which already includes this change."""
+    changes = {field: F(field) + count for field, count in team_counts.items() if count}
+    if first_date:
+        changes['first_meal_date'] = Least(F('first_meal_date'), first_date)
+    team_stats = TeamStats.objects.filter(team_id=team_id)
+    if not (team_stats.update(**changes) if changes else team_stats.exists()):
+        rebuild_team_stats(team_id)
+        return
+
+    rows = [(team_id, dish_id, counts['planned'], counts['cooked'], counts['eaten'])
+            for dish_id, counts in dish_counts.items() if any(counts.values())]
+    if rows:
+        sql = UPSERT_DISH_STATS_SQL.format(values=', '.join(['(%s, %s, %s, %s, %s)'] * len(rows)))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [value for row in rows for value in row])
+
+
+def rebuild_team_stats(team_id):
+    """Work out all of one team's stats from its meals and courses
+
+    Holds a lock on the team's row while it works, so two rebuilds of one
+    team (two first visits to its page, say) take turns rather than both
+    inserting its TeamStats.
+    Returns the team's TeamStats"""
+    with transaction.atomic():
+        list(Team.objects.select_for_update().filter(id=team_id).values_list('id', flat=True))
+        meal_counts = Meal.objects.filter(team_id=team_id)\
+                                  .order_by()\
+                                  .values('meal_type')\
+                                  .annotate(meals=Count('id'), first_date=Min('date'))
+
+        def count_where(condition):
+            return Sum(Case(When(condition, then=1), default=0, output_field=IntegerField()))
+
+        cook = Q(meal__meal_prep='cook')
+        dish_counts = Course.objects.filter(meal__team_id=team_id)\
+                                    .order_by()\
+                                    .values('dish_id')\
+                                    .annotate(planned=Count('id'),
+                                              cooked_courses=count_where(cook & Q(prepared=True)),
+                                              eaten_courses=count_where(Q(eaten=True)),
+                                              cook_courses=count_where(cook),
+                                              eaten_cook_courses=count_where(cook & Q(eaten=True)))
+
+        stats = TeamStats(team_id=team_id)
+        for row in meal_counts:
+            if row['meal_type'] in MEAL_TYPE_FIELDS:
+                setattr(stats, MEAL_TYPE_FIELDS[row['meal_type']], row['meals'])
+            if not stats.first_meal_date or row['first_date'] < stats.first_meal_date:
+                stats.first_meal_date = row['first_date']
+
+        dish_stats = []
+        for row in dish_counts:
+            stats.cook_courses += row['cook_courses']
+            stats.prepared_cook_courses += row['cooked_courses']
+            stats.eaten_cook_courses += row['eaten_cook_courses']
+            dish_stats.append(TeamDishStats(team_id=team_id, dish_id=row['dish_id'],
+                                            planned=row['planned'], cooked=row['cooked_courses'],
+                                            eaten=row['eaten_courses']))
+
+        TeamStats.objects.filter(team_id=team_id).delete()
+        TeamDishStats.objects.filter(team_id=team_id).delete()
+        stats.save(force_insert=True)
+        TeamDishStats.objects.bulk_create(dish_stats)
+        return stats
+
+
+def dish_leaderboard(team, metric='planned', days=None, limit=10):
+    """A team's top dishes by how often they were planned, cooked or eaten,
+    as a list of {'id', 'name', 'count'}, most first
+
+    All-time boards are read from TeamDishStats. For the last `days` days
+    the team's courses in that window are counted instead, with the meal
+    filter served by the (team, meal_prep, date) index."""
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError('Unknown leaderboard metric %s' % metric)
+
+    if days is None:
+        counts = TeamDishStats.objects.filter(team=team, **{metric + '__gte': 1})\
+                                      .order_by('-' + metric, 'dish_id')\
+                                      .values_list('dish_id', metric)[:limit]
+    else:
+        # Today and the days - 1 before it, like the plan rates next to them
+        today = date.today()
+        courses = Course.objects.filter(meal__team=team,
+                                        meal__date__range=(today - timedelta(days=days - 1),
+                                                           today))
+        if metric == 'cooked':
+            courses = courses.filter(meal__meal_prep='cook', prepared=True)
+        elif metric == 'eaten':
+            courses = courses.filter(eaten=True)
+        counts = courses.order_by()\
+                        .values('dish_id')\
+                        .annotate(count=Count('id'))\
+                        .order_by('-count', 'dish_id')\
+                        .values_list('dish_id', 'count')[:limit]
+
+    counts = list(counts)
+    dishes = Dish.objects.only('id', 'name').in_bulk([dish_id for dish_id, _ in counts])
+    return [{'id': dish_id, 'name': dishes[dish_id].name, 'count': count}
+            for dish_id, count in counts]
+
+
+class WeekStart(Func):
+    """The Monday starting a date's week"""
+    function = 'DATE_TRUNC'
+    template = "CAST(%(function)s('week', %(expressions)s) AS date)"
+
+    def __init__(self, expression, **extra):
+        super(WeekStart, self).__init__(expression, output_field=DateField(), **extra)
+
+
+def coverage_rates(counts, days):
+    """Percent of days with each meal type planned, and overall"""
+    meal_types = [meal_type for meal_type, _ in Meal.MEAL_TYPE_CHOICES]
+    rates = [{'meal_type': meal_type,
+              'meals': counts[meal_type],
+              'rate': counts[meal_type] * 100 // days}
+             for meal_type in meal_types]
+    total = sum(counts[meal_type] for meal_type in meal_types)
+    return rates, total * 100 // (days * len(meal_types))
+
+
+def planning_coverage(team, start=None, end=None):
+    """How many of the days from start to end (inclusive) the team planned
+    each type of meal for, in total and week by week
+
+    start defaults to the team's first meal and end to today. All the
+    counts come from one query grouped by week and meal type. Returns
+    {'start', 'end', 'days', 'meal_types', 'rate', 'weeks'}, where
+    meal_types is a list of {'meal_type', 'meals', 'rate'} in the order of
+    Meal.MEAL_TYPE_CHOICES, rate is the overall percent, and weeks is a
+    list of {'monday', 'days', 'meal_types', 'rate'} for each week."""
+    end = end or date.today()
+    meals = Meal.objects.filter(team=team, date__lte=end)
+    if start:
+        meals = meals.filter(date__gte=start)
+    rows = list(meals.order_by()
+                     .annotate(week=WeekStart('date'))
+                     .values('week', 'meal_type')
+                     .annotate(meals=Count('id'), first_date=Min('date')))
+    if start is None:
+        start = min([row['first_date'] for row in rows] or [end])
+
+    totals = Counter()
+    week_counts = OrderedDict()
+    monday = start - timedelta(days=start.weekday())
+    while monday <= end:
+        week_counts[monday] = Counter()
+        monday += timedelta(weeks=1)
+    for row in rows:
+        totals[row['meal_type']] += row['meals']
+        week_counts[row['week']][row['meal_type']] += row['meals']
+
+    weeks = []
+    for monday, counts in week_counts.items():
+        days = (min(monday + timedelta(days=6), end) - max(monday, start)).days + 1
+        meal_types, rate = coverage_rates(counts, days)
+        weeks.append({'monday': monday, 'days': days, 'meal_types': meal_types, 'rate': rate})
+
+    days = (end - start).days + 1
+    meal_types, rate = coverage_rates(totals, days)
+    return {'start': start, 'end': end, 'days': days,
+            'meal_types': meal_types, 'rate': rate, 'weeks': weeks}
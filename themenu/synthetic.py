@@ -0,0 +1,303 @@
+"""Filling the database with made-up teams, dishes and plans
+
+For measuring the site at a realistic size (see the benchmark and
+explain_hot_queries commands). Everything is written with bulk inserts,
+so none of the signals run, and the denormalized data they would have
+kept up to date (groceries, search vectors, tag and ingredient counts,
+review scores, team stats) is then filled in with a few queries over
+just the new rows.
+
+Team, user, tag and ingredient names start with a prefix (and dishes'
+notes mention it), different for each run unless one is given, so a run
+can be added on top of another and its rows found again."""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from themenu.caching import CATALOG, bump_version, team_scope
+from themenu.counts import reconcile_counts
+from themenu.models import (
+    Course, Dish, DishReview, Ingredient, IngredientAmount, Meal, MyUser,
+    RandomGroceryItem, Tag, Team,
+)
+from themenu.search import update_dish_search
+from themenu.stats import rebuild_team_stats
+
+# How likely a team is to plan each type of meal on any one day
+MEAL_TYPE_ODDS = {
+    'breakfast': 0.5,
+    'lunch': 0.6,
+    'dinner': 0.9,
+    'dessert': 0.2,
+    'snack': 0.2,
+    'tapas': 0.05,
+}
+
+MEAL_PREP_WEIGHTS = [('cook', 6), ('buy', 2), ('leftover', 2)]
+
+ADJECTIVES = ['smoky', 'crispy', 'spicy', 'creamy', 'roasted', 'grilled', 'braised',
+              'sticky', 'zesty', 'garlicky', 'slow-cooked', 'quick', 'herby', 'golden']
+FOODS = ['onion', 'garlic', 'tomato', 'lentil', 'chickpea', 'chicken', 'salmon', 'tofu',
+         'rice', 'potato', 'spinach', 'mushroom', 'pepper', 'carrot', 'lemon', 'ginger',
+         'noodle', 'bean', 'squash', 'cheese', 'egg', 'pork', 'beef', 'cabbage']
+DISH_KINDS = ['stew', 'salad', 'curry', 'soup', 'bake', 'stir fry', 'tacos', 'pie',
+              'risotto', 'pasta', 'bowl', 'sandwich', 'skillet', 'roast']
+AMOUNTS = ['1', '2', '3', '1 cup', '2 cups', '1/2 cup', '1 1/2 cups', '1 tbsp',
+           '2 tbsp', '1 tsp', '1/2 tsp', '100 g', '250 g', '1 lb', '1 can',
+           'a pinch', 'to taste', '2 cloves, minced', '1 bunch, chopped']
+TAG_WORDS = ['vegetarian', 'vegan', 'quick', 'weeknight', 'comfort', 'spicy', 'summer',
+             'winter', 'freezer', 'kids', 'party', 'healthy', 'budget', 'one pot']
+GROCERIES = ['paper towels', 'dish soap', 'coffee', 'milk', 'bread', 'bananas',
+             'olive oil', 'foil', 'sparkling water', 'butter']
+
+BATCH_SIZE = 1000
+
+# Groceries for every course of these teams' meals, as sync_course_groceries
+# would have made them, already bought for the meals before today
+INSERT_GROCERIES_SQL = """
+INSERT INTO themenu_grocerylistitem
+    (course_id, ingredient_amount_id, purchased, team_id, meal_date, ingredient_id)
+SELECT themenu_course.id, dish_amounts.ingredientamount_id, themenu_meal.date < %(today)s,
+       themenu_meal.team_id, themenu_meal.date, themenu_ingredientamount.ingredient_id
+FROM themenu_course
+JOIN themenu_meal ON themenu_meal.id = themenu_course.meal_id
+JOIN themenu_dish_ingredient_amounts AS dish_amounts
+    ON dish_amounts.dish_id = themenu_course.dish_id
+JOIN themenu_ingredientamount
+    ON themenu_ingredientamount.id = dish_amounts.ingredientamount_id
+WHERE themenu_meal.team_id = ANY(%(team_ids)s)
+  AND themenu_meal.meal_prep IS DISTINCT FROM 'leftover'
+"""
+
+# Dish.update_review_scores for every dish whose id is passed in, at once
+UPDATE_REVIEW_SCORES_SQL = """
+UPDATE themenu_dish
+SET review_count = scores.review_count,
+    avg_fastness = scores.avg_fastness,
+    avg_ease = scores.avg_ease,
+    avg_results = scores.avg_results
+FROM (SELECT dish_id,
+             COUNT(*) AS review_count,
+             AVG(fastness) AS avg_fastness,
+             AVG(ease) AS avg_ease,
+             AVG(results) AS avg_results
+      FROM themenu_dishreview
+      WHERE dish_id = ANY(%(dish_ids)s)
+      GROUP BY dish_id) AS scores
+WHERE scores.dish_id = themenu_dish.id
+"""
+
+
+def weighted_choice(rng, weights):
+    """One of the values in a list of (value, weight)"""
+    pick = rng.uniform(0, sum(weight for _, weight in weights))
+    for value, weight in weights:
+        pick -= weight
+        if pick <= 0:
+            return value
+    return weights[-1][0]
+
+
+def bulk_create(model, objects):
+    """Insert the objects BATCH_SIZE at a time, setting their ids"""
+    return model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+def make_tags(rng, prefix, count):
+    """Returns the new tags' ids"""
+    tags = bulk_create(Tag, [Tag(name=('%s %s %d' % (prefix, rng.choice(TAG_WORDS), i))[:48])
+                             for i in range(count)])
+    return [tag.id for tag in tags]
+
+
+def make_teams(rng, prefix, count, users_per_team):
+    """Returns the new teams' ids and {team id: [its members' MyUser ids]}"""
+    teams = bulk_create(Team, [Team(name='%s team %d' % (prefix, i)) for i in range(count)])
+    users = []
+    for team in teams:
+        for i in range(users_per_team):
+            user = User(username='%s-%d-%d' % (prefix, team.id, i))
+            user.set_unusable_password()
+            users.append(user)
+    users = bulk_create(User, users)
+    # MyUsers are normally made by a signal when a user is saved
+    myusers = bulk_create(MyUser, [MyUser(user_id=user.id, team_id=teams[i // users_per_team].id)
+                                   for i, user in enumerate(users)])
+    members = {team.id: [] for team in teams}
+    for myuser in myusers:
+        members[myuser.team_id].append(myuser.id)
+    return [team.id for team in teams], members
+
+
+def make_ingredients(rng, prefix, count, amounts_per_ingredient):
+    """Returns {ingredient id: [its amounts' ids]}"""
+    ingredients = bulk_create(Ingredient, [
+        Ingredient(name='%s %s %d' % (prefix, rng.choice(FOODS), i)) for i in range(count)])
+    amounts = []
+    for ingredient in ingredients:
+        for text in rng.sample(AMOUNTS, min(amounts_per_ingredient, len(AMOUNTS))):
+            amount = IngredientAmount(ingredient_id=ingredient.id, amount=text)
+            amount.parse_amount()
+            amounts.append(amount)
+    amounts_by_ingredient = {ingredient.id: [] for ingredient in ingredients}
+    for amount in bulk_create(IngredientAmount, amounts):
+        amounts_by_ingredient[amount.ingredient_id].append(amount.id)
+    return amounts_by_ingredient
+
+
+def make_dishes(rng, prefix, count, creator_ids, tag_ids, amounts_by_ingredient,
+                ingredients_per_dish):
+    """Dishes with a few tags and about ingredients_per_dish ingredients each
+    Returns the new dishes' ids"""
+    dishes = bulk_create(Dish, [
+        Dish(name='%s %s %s %s' % (rng.choice(ADJECTIVES), rng.choice(FOODS),
+                                   rng.choice(DISH_KINDS), i),
+             created_by_id=rng.choice(creator_ids),
+             notes='Made up by %s' % prefix,
+             recipe=' '.join(rng.choice(FOODS + DISH_KINDS) for _ in range(40)))
+        for i in range(count)])
+    dish_ids = [dish.id for dish in dishes]
+
+    ingredient_ids = list(amounts_by_ingredient)
+    DishTag = Dish.tags.through
+    DishAmount = Dish.ingredient_amounts.through
+    dish_tags = []
+    dish_amounts = []
+    for dish_id in dish_ids:
+        for tag_id in rng.sample(tag_ids, min(rng.randint(0, 3), len(tag_ids))):
+            dish_tags.append(DishTag(dish_id=dish_id, tag_id=tag_id))
+        size = rng.randint(max(1, ingredients_per_dish // 2), ingredients_per_dish * 3 // 2)
+        for ingredient_id in rng.sample(ingredient_ids, min(size, len(ingredient_ids))):
+            dish_amounts.append(DishAmount(
+                dish_id=dish_id,
+                ingredientamount_id=rng.choice(amounts_by_ingredient[ingredient_id])))
+    bulk_create(DishTag, dish_tags)
+    bulk_create(DishAmount, dish_amounts)
+    return dish_ids
+
+
+def make_reviews(rng, dish_ids, myuser_ids, reviews_per_dish):
+    """About reviews_per_dish reviews of each dish, by different users,
+    scoring it around how good it is
+    Returns the number of reviews made"""
+    reviews = []
+    for dish_id in dish_ids:
+        quality = rng.randint(1, 3)
+        count = min(rng.randint(0, reviews_per_dish * 2), len(myuser_ids))
+        for myuser_id in rng.sample(myuser_ids, count):
+            def score():
+                return min(3, max(1, quality + rng.randint(-1, 1)))
+            reviews.append(DishReview(myuser_id=myuser_id, dish_id=dish_id,
+                                      fastness=score(), ease=score(), results=score()))
+    return len(bulk_create(DishReview, reviews))
+
+
+def make_meals(rng, team_id, start, end, dish_ids, tag_ids, favorites):
+    """Plan a team's meals on every day from start to end (inclusive)
+
+    Most courses are one of the team's favorite dishes. Meals before
+    today are mostly prepared and eaten.
+    Returns the number of meals and of courses made"""
+    favorite_ids = rng.sample(dish_ids, min(favorites, len(dish_ids)))
+    meal_types = [meal_type for meal_type, _ in Meal.MEAL_TYPE_CHOICES]
+    today = date.today()
+    meals = []
+    day = start
+    while day <= end:
+        for meal_type in meal_types:
+            if rng.random() < MEAL_TYPE_ODDS[meal_type]:
+                meals.append(Meal(team_id=team_id, date=day, meal_type=meal_type,
+                                  meal_prep=weighted_choice(rng, MEAL_PREP_WEIGHTS)))
+        day += timedelta(days=1)
+    meals = bulk_create(Meal, meals)
+
+    MealTag = Meal.tags.through
+    courses = []
+    meal_tags = []
+    for meal in meals:
+        past = meal.date < today
+        course_dish_ids = set()
+        for _ in range(rng.randint(1, 3)):
+            course_dish_ids.add(rng.choice(favorite_ids if rng.random() < 0.8 else dish_ids))
+        for dish_id in course_dish_ids:
+            courses.append(Course(meal_id=meal.id, dish_id=dish_id,
+                                  prepared=past and meal.meal_prep == 'cook' and rng.random() < 0.9,
+                                  eaten=past and rng.random() < 0.9))
+        if tag_ids and rng.random() < 0.1:
+            meal_tags.append(MealTag(meal_id=meal.id, tag_id=rng.choice(tag_ids)))
+    bulk_create(Course, courses)
+    bulk_create(MealTag, meal_tags)
+    return len(meals), len(courses)
+
+
+def make_random_groceries(rng, team_ids, per_team):
+    """Returns the number of random grocery items made"""
+    items = [RandomGroceryItem(team_id=team_id, name=rng.choice(GROCERIES),
+                               purchased=rng.random() < 0.5)
+             for team_id in team_ids for _ in range(per_team)]
+    return len(bulk_create(RandomGroceryItem, items))
+
+
+def fill_derived_data(team_ids, dish_ids):
+    """Work out what the signals would have kept up to date for the new
+    teams and dishes
+    Returns the number of groceries made"""
+    with connection.cursor() as cursor:
+        cursor.execute(INSERT_GROCERIES_SQL, {'today': date.today(), 'team_ids': team_ids})
+        groceries = cursor.rowcount
+        cursor.execute(UPDATE_REVIEW_SCORES_SQL, {'dish_ids': dish_ids})
+    for batch in range(0, len(dish_ids), BATCH_SIZE):
+        update_dish_search(dish_ids[batch:batch + BATCH_SIZE])
+    reconcile_counts()
+    for team_id in team_ids:
+        rebuild_team_stats(team_id)
+        bump_version(team_scope(team_id))
+    bump_version(CATALOG)
+    return groceries
+
+
+def generate(prefix, teams=10, users_per_team=3, years=2, days_ahead=14, dishes=2000,
+             ingredients=500, amounts_per_ingredient=4, ingredients_per_dish=8,
+             tags=40, reviews_per_dish=2, favorites=150, random_groceries=10, seed=None):
+    """Make the teams, their users and years of meals, and a catalog of
+    dishes, ingredients, tags and reviews shared with everyone, in one
+    transaction, then ANALYZE so the planner knows about them
+    Returns [(what, how many were made)]"""
+    rng = random.Random(seed)
+    today = date.today()
+    with transaction.atomic():
+        tag_ids = make_tags(rng, prefix, tags)
+        team_ids, members = make_teams(rng, prefix, teams, users_per_team)
+        myuser_ids = [myuser_id for team_id in team_ids for myuser_id in members[team_id]]
+        amounts_by_ingredient = make_ingredients(rng, prefix, ingredients, amounts_per_ingredient)
+        dish_ids = make_dishes(rng, prefix, dishes, myuser_ids, tag_ids, amounts_by_ingredient,
+                               ingredients_per_dish)
+        reviews = make_reviews(rng, dish_ids, myuser_ids, reviews_per_dish)
+        meals = courses = 0
+        for team_id in team_ids:
+            team_meals, team_courses = make_meals(rng, team_id,
+                                                  today - timedelta(days=365 * years),
+                                                  today + timedelta(days=days_ahead),
+                                                  dish_ids, tag_ids, favorites)
+            meals += team_meals
+            courses += team_courses
+        other_groceries = make_random_groceries(rng, team_ids, random_groceries)
+        groceries = fill_derived_data(team_ids, dish_ids)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return [
+        ('teams', len(team_ids)),
+        ('users', len(myuser_ids)),
+        ('tags', len(tag_ids)),
+        ('ingredients', len(amounts_by_ingredient)),
+        ('ingredient amounts', sum(len(ids) for ids in amounts_by_ingredient.values())),
+        ('dishes', len(dish_ids)),
+        ('reviews', reviews),
+        ('meals', meals),
+        ('courses', courses),
+        ('groceries', groceries),
+        ('random groceries', other_groceries),
+    ]
@@ -0,0 +1,617 @@
+import json
+import tempfile
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from themenu.amounts import compact_ingredient_amounts
+from themenu.groceries import sync_course_groceries
+from themenu.ingredients import set_dish_ingredients
+from themenu.management.commands.explain_hot_queries import (
+    INDEX_SCANS, explain_scans, hot_queries,
+)
+from themenu.models import (
+    Course, Dish, GroceryListItem, Ingredient, IngredientAmount, Meal, Tag, Team, TeamDishStats,
+    TeamStats,
+)
+from themenu.plans import week_start
+from themenu.stats import dish_leaderboard, rebuild_team_stats
+from themenu.synthetic import generate
+from themenu.views import save_meal_courses
+
+
+# A cache every process would share, like memcached in production
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='themenu-test-cache'),
+    },
+    'select2': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+
+def make_member(username, team):
+    """A user on the team, with the MyUser the signal makes for them"""
+    user = User.objects.create_user(username, password='password')
+    user.myuser.team = team
+    user.myuser.save()
+    return user
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class CalendarQueriesTest(TestCase):
+    """The calendar loads a week with a fixed number of queries, however
+    many meals, courses and tags it shows"""
+
+    # session, user, team modified time for the ETag, myuser, team,
+    # meals, courses with their dishes, meal tags
+    CALENDAR_QUERIES = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='testers')
+        cls.user = make_member('alice', cls.team)
+        cls.dishes = [Dish.objects.create(name='dish %d' % i, created_by=cls.user.myuser)
+                      for i in range(3)]
+        cls.tag = Tag.objects.create(name='weeknight')
+        cls.monday = week_start(date.today())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def plan_meals(self, days, meal_types):
+        for day in range(days):
+            for meal_type in meal_types:
+                meal = Meal.objects.create(team=self.team, meal_type=meal_type,
+                                           meal_prep='cook',
+                                           date=self.monday + timedelta(days=day))
+                for dish in self.dishes:
+                    Course.objects.create(meal=meal, dish=dish)
+                meal.tags.add(self.tag)
+
+    def get_calendar(self):
+        response = self.client.get(reverse('calendar', args=[self.monday.strftime('%Y%m%d')]))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_empty_week(self):
+        # Nothing to prefetch courses or tags for
+        with self.assertNumQueries(self.CALENDAR_QUERIES - 2):
+            self.get_calendar()
+
+    def test_one_meal(self):
+        self.plan_meals(1, ['dinner'])
+        with self.assertNumQueries(self.CALENDAR_QUERIES):
+            self.get_calendar()
+
+    def test_full_week(self):
+        self.plan_meals(7, [meal_type for meal_type, _ in Meal.MEAL_TYPE_CHOICES])
+        with self.assertNumQueries(self.CALENDAR_QUERIES):
+            response = self.get_calendar()
+        self.assertContains(response, 'Dish 2', count=7 * len(Meal.MEAL_TYPE_CHOICES))
+
+
+class GroceryReconcileTest(TestCase):
+    """sync_course_groceries leaves the same groceries as working out
+    every course's list from scratch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='testers')
+        cls.user = make_member('alice', cls.team)
+        cls.amounts = [IngredientAmount.objects.create(
+                           ingredient=Ingredient.objects.create(name='ingredient %d' % i),
+                           amount='%d cups' % i)
+                       for i in range(1, 5)]
+        cls.dish = Dish.objects.create(name='stew', created_by=cls.user.myuser)
+        cls.dish.ingredient_amounts.set(cls.amounts[:3])
+        cls.other_dish = Dish.objects.create(name='salad', created_by=cls.user.myuser)
+        cls.other_dish.ingredient_amounts.set(cls.amounts[2:])
+
+    def plan(self, meal_prep='cook', day=0):
+        meal = Meal.objects.create(team=self.team, meal_type='dinner', meal_prep=meal_prep,
+                                   date=date.today() + timedelta(days=day))
+        return [Course.objects.create(meal=meal, dish=self.dish),
+                Course.objects.create(meal=meal, dish=self.other_dish)]
+
+    def resync(self, courses):
+        sync_course_groceries(Course.objects.select_related('meal')
+                                            .filter(id__in=[course.id for course in courses]))
+
+    def recounted(self):
+        """(course, amount, team, date, ingredient) for every grocery each
+        course should have, found one course at a time"""
+        wanted = []
+        for course in Course.objects.all():
+            if course.meal.meal_prep == 'leftover':
+                continue
+            for amount in course.dish.ingredient_amounts.all():
+                wanted.append((course.id, amount.id, course.meal.team_id, course.meal.date,
+                               amount.ingredient_id))
+        return sorted(wanted)
+
+    def unpurchased(self):
+        return sorted(GroceryListItem.objects.filter(purchased=False).values_list(
+            'course_id', 'ingredient_amount_id', 'team_id', 'meal_date', 'ingredient_id'))
+
+    def test_new_courses(self):
+        self.plan()
+        self.plan(day=1)
+        self.assertEqual(self.unpurchased(), self.recounted())
+
+    def test_dish_changed(self):
+        courses = self.plan()
+        self.dish.ingredient_amounts.set(self.amounts[1:])
+        self.resync(courses)
+        self.assertEqual(self.unpurchased(), self.recounted())
+
+    def test_purchased_groceries_are_kept(self):
+        courses = self.plan()
+        bought = GroceryListItem.objects.get(course=courses[0], ingredient_amount=self.amounts[0])
+        bought.purchased = True
+        bought.save()
+        self.dish.ingredient_amounts.set(self.amounts[1:])
+        self.resync(courses)
+        self.assertEqual(self.unpurchased(), self.recounted())
+        self.assertTrue(GroceryListItem.objects.filter(id=bought.id, purchased=True).exists())
+
+    def test_duplicates_are_removed(self):
+        courses = self.plan()
+        duplicate = GroceryListItem.objects.filter(course=courses[0]).first()
+        duplicate.pk = None
+        duplicate.save()
+        self.resync(courses)
+        self.assertEqual(self.unpurchased(), self.recounted())
+
+    def test_leftovers_need_no_groceries(self):
+        self.plan(meal_prep='leftover')
+        self.plan(day=1)
+        self.assertEqual(self.unpurchased(), self.recounted())
+        self.assertFalse(GroceryListItem.objects.filter(course__meal__meal_prep='leftover').exists())
+
+    def test_teamless_user_cant_check_off(self):
+        courses = self.plan()
+        GroceryListItem.objects.filter(course__in=courses).update(team=None)
+        loner = User.objects.create_user('bob', password='password')
+        self.client.force_login(loner)
+        for url, update in [('grocery-update', {'groceryType': 'meal', 'checked': True,
+                                                'groceryId': list(GroceryListItem.objects
+                                                                  .values_list('id', flat=True))}),
+                            ('course-update', {'mealId': courses[0].meal_id, 'checked': True,
+                                               'dishId': self.dish.id, 'attribute': 'eaten'})]:
+            response = self.client.post(reverse(url), json.dumps(update),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(GroceryListItem.objects.filter(purchased=True).exists())
+
+    def test_meal_moved(self):
+        courses = self.plan()
+        meal = courses[0].meal
+        meal.date += timedelta(days=3)
+        meal.save()
+        self.assertEqual(self.unpurchased(), self.recounted())
+
+
+class TeamStatsTest(TestCase):
+    """The running totals kept as meals are planned, checked off and
+    deleted through the site match the stats worked out from scratch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='testers')
+        cls.user = make_member('alice', cls.team)
+        cls.dishes = [Dish.objects.create(name='dish %d' % i, created_by=cls.user.myuser)
+                      for i in range(4)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.team.get_stats()
+
+    def snapshot(self):
+        team_stats = TeamStats.objects.filter(team=self.team).values(
+            'first_meal_date', 'breakfasts', 'lunches', 'dinners', 'desserts', 'snacks', 'tapas',
+            'cook_courses', 'prepared_cook_courses', 'eaten_cook_courses').get()
+        # Rows that have gone back to nothing are left behind by the totals
+        dish_stats = sorted(TeamDishStats.objects.filter(team=self.team)
+                                                 .exclude(planned=0, cooked=0, eaten=0)
+                                                 .values_list('dish_id', 'planned', 'cooked',
+                                                              'eaten'))
+        return team_stats, dish_stats
+
+    def assertStatsRebuilt(self):
+        kept = self.snapshot()
+        rebuild_team_stats(self.team.id)
+        self.assertEqual(kept, self.snapshot())
+
+    def save_meal(self, meal_type, days, dishes, meal_prep='cook', meal=None):
+        data = {'meal_type': meal_type, 'meal_prep': meal_prep,
+                'date': (date.today() + timedelta(days=days)).isoformat(),
+                'dishes': [dish.id for dish in dishes]}
+        url = reverse('meal-update', args=[meal.id]) if meal else reverse('meal-create')
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        return Meal.objects.get(team=self.team, meal_type=meal_type,
+                                date=date.today() + timedelta(days=days))
+
+    def check_courses(self, updates):
+        response = self.client.post(reverse('course-update'), json.dumps({'updates': [
+            {'mealId': meal.id, 'dishId': dish.id, 'attribute': attribute, 'checked': checked}
+            for meal, dish, attribute, checked in updates]}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_planning(self):
+        self.save_meal('dinner', -2, self.dishes[:2])
+        self.save_meal('lunch', -3, self.dishes[1:3], meal_prep='buy')
+        self.save_meal('breakfast', 1, self.dishes[:1])
+        self.assertStatsRebuilt()
+
+    def test_changing_meals(self):
+        dinner = self.save_meal('dinner', -2, self.dishes[:2])
+        self.save_meal('dinner', -2, self.dishes[1:], meal_prep='buy', meal=dinner)
+        self.assertStatsRebuilt()
+        self.save_meal('dessert', -5, self.dishes[2:], meal=dinner)
+        self.assertStatsRebuilt()
+
+    def test_checking_off_courses(self):
+        dinner = self.save_meal('dinner', -1, self.dishes[:3])
+        self.check_courses([(dinner, self.dishes[0], 'prepared', True),
+                            (dinner, self.dishes[1], 'eaten', True),
+                            (dinner, self.dishes[2], 'eaten', True),
+                            (dinner, self.dishes[2], 'eaten', False)])
+        self.assertStatsRebuilt()
+
+    def test_deleting_meals(self):
+        first = self.save_meal('lunch', -10, self.dishes[:2])
+        self.save_meal('dinner', -1, self.dishes[1:3])
+        self.check_courses([(first, self.dishes[0], 'prepared', True)])
+        response = self.client.post(reverse('meal-delete', args=[first.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertStatsRebuilt()
+        self.assertEqual(TeamStats.objects.get(team=self.team).first_meal_date,
+                         date.today() - timedelta(days=1))
+
+    def test_leaderboard_window(self):
+        self.save_meal('dinner', 0, self.dishes[:1])
+        self.save_meal('dinner', -29, self.dishes[:1])
+        self.save_meal('dinner', -30, self.dishes[:1])
+        self.assertEqual(dish_leaderboard(self.team, days=30),
+                         [{'id': self.dishes[0].id, 'name': 'dish 0', 'count': 2}])
+
+    def test_days_outside_the_windows(self):
+        url = reverse('team-detail', args=[self.team.id])
+        response = self.client.get(url, {'days': 30})
+        self.assertEqual(response.context['days'], 30)
+        # Too far back for a date, so it would overflow if it were used
+        for days in (100000000, 45, -30, 'all'):
+            response = self.client.get(url, {'days': days})
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context['days'])
+
+
+class TagCountsTest(TestCase):
+    """The counts kept on each tag match counting its dishes, ingredients
+    and meals again, whichever side of the m2m is changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='testers')
+        cls.user = make_member('alice', cls.team)
+        cls.tags = [Tag.objects.create(name='tag %d' % i) for i in range(3)]
+        cls.dishes = [Dish.objects.create(name='dish %d' % i, created_by=cls.user.myuser)
+                      for i in range(3)]
+        cls.ingredients = [Ingredient.objects.create(name='ingredient %d' % i) for i in range(2)]
+        cls.meal = Meal.objects.create(team=cls.team, meal_type='dinner', date=date.today())
+
+    def assertCountsMatch(self):
+        kept = sorted(Tag.objects.values_list('id', 'dish_count', 'ingredient_count',
+                                              'meal_count'))
+        counted = sorted(Tag.objects.annotate(dishes=Count('dish', distinct=True),
+                                              ingredients=Count('ingredient', distinct=True),
+                                              meals=Count('meal', distinct=True))
+                                    .values_list('id', 'dishes', 'ingredients', 'meals'))
+        self.assertEqual(kept, counted)
+
+    def test_dish_tags(self):
+        self.dishes[0].tags.add(*self.tags)
+        self.dishes[1].tags.set(self.tags[:2])
+        self.assertCountsMatch()
+        self.dishes[1].tags.set(self.tags[1:])
+        self.dishes[0].tags.remove(self.tags[0])
+        self.assertCountsMatch()
+        self.dishes[0].tags.clear()
+        self.assertCountsMatch()
+
+    def test_tag_side(self):
+        self.tags[0].dish_set.add(*self.dishes)
+        self.tags[0].ingredient_set.add(*self.ingredients)
+        self.tags[0].meal_set.add(self.meal)
+        self.assertCountsMatch()
+        self.tags[0].dish_set.remove(self.dishes[0])
+        self.assertCountsMatch()
+        self.tags[0].dish_set.clear()
+        self.tags[0].ingredient_set.clear()
+        self.tags[0].meal_set.clear()
+        self.assertCountsMatch()
+
+    def test_ingredient_and_meal_tags(self):
+        self.ingredients[0].tags.set(self.tags)
+        self.ingredients[1].tags.add(self.tags[0])
+        self.meal.tags.set(self.tags[1:])
+        self.assertCountsMatch()
+        self.meal.tags.clear()
+        self.ingredients[0].tags.remove(self.tags[1])
+        self.assertCountsMatch()
+
+    def test_deletes(self):
+        for dish in self.dishes:
+            dish.tags.set(self.tags)
+        self.ingredients[0].tags.set(self.tags)
+        self.meal.tags.set(self.tags)
+        # Fresh copies, so the shared ones keep their ids for other tests
+        Dish.objects.get(id=self.dishes[0].id).delete()
+        Ingredient.objects.get(id=self.ingredients[0].id).delete()
+        Meal.objects.get(id=self.meal.id).delete()
+        self.assertCountsMatch()
+
+
+class IngredientCountsTest(TestCase):
+    """The dish count kept on each ingredient matches counting the dishes
+    using any of its amounts again"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_member('alice', Team.objects.create(name='testers'))
+        cls.ingredients = [Ingredient.objects.create(name='ingredient %d' % i) for i in range(3)]
+        cls.amounts = [IngredientAmount.objects.create(ingredient=ingredient, amount=amount)
+                       for ingredient in cls.ingredients for amount in ('1 cup', '2 cups')]
+        cls.dishes = [Dish.objects.create(name='dish %d' % i, created_by=cls.user.myuser)
+                      for i in range(3)]
+
+    def assertCountsMatch(self):
+        kept = sorted(Ingredient.objects.values_list('id', 'dish_count'))
+        counted = sorted(Ingredient.objects.annotate(
+            dishes=Count('ingredientamount__dish', distinct=True)).values_list('id', 'dishes'))
+        self.assertEqual(kept, counted)
+
+    def test_dish_side(self):
+        # Two amounts of one ingredient still make one dish
+        self.dishes[0].ingredient_amounts.set(self.amounts[:3])
+        self.dishes[1].ingredient_amounts.add(*self.amounts[2:])
+        self.assertCountsMatch()
+        self.dishes[0].ingredient_amounts.remove(self.amounts[0])
+        self.assertCountsMatch()
+        self.dishes[0].ingredient_amounts.remove(self.amounts[1])
+        self.dishes[1].ingredient_amounts.clear()
+        self.assertCountsMatch()
+
+    def test_amount_side(self):
+        self.amounts[0].dish_set.add(*self.dishes)
+        self.amounts[1].dish_set.add(self.dishes[0])
+        self.assertCountsMatch()
+        self.amounts[0].dish_set.remove(self.dishes[1])
+        self.assertCountsMatch()
+        self.amounts[0].dish_set.clear()
+        self.assertCountsMatch()
+
+    def test_set_dish_ingredients(self):
+        set_dish_ingredients(self.dishes[0], [(self.ingredients[0].id, '1 cup'),
+                                              (self.ingredients[1].id, '3 tbsp')])
+        self.assertCountsMatch()
+        set_dish_ingredients(self.dishes[0], [(self.ingredients[2].id, '1 cup')])
+        self.assertCountsMatch()
+
+    def test_deletes(self):
+        for dish in self.dishes:
+            dish.ingredient_amounts.set(self.amounts[::2])
+        Dish.objects.get(id=self.dishes[0].id).delete()
+        IngredientAmount.objects.get(id=self.amounts[2].id).delete()
+        self.assertCountsMatch()
+
+
+class CompactAmountsTest(TestCase):
+    """Merging amounts that only differ in case and spacing leaves each
+    course one grocery per amount, as syncing it would"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='testers')
+        cls.user = make_member('alice', cls.team)
+        flour = Ingredient.objects.create(name='flour')
+        cls.kept = IngredientAmount.objects.create(ingredient=flour, amount='1 cup')
+        cls.duplicate = IngredientAmount.objects.create(ingredient=flour, amount='1 cups')
+        # Saved before amounts were tidied up on save
+        IngredientAmount.objects.filter(id=cls.duplicate.id).update(amount=' 1  Cup')
+        cls.dish = Dish.objects.create(name='bread', created_by=cls.user.myuser)
+        cls.dish.ingredient_amounts.set([cls.kept, cls.duplicate])
+
+    def plan(self):
+        meal = Meal.objects.create(team=self.team, meal_type='dinner', date=date.today())
+        return Course.objects.create(meal=meal, dish=self.dish)
+
+    def compact(self):
+        with connection.cursor() as cursor:
+            self.assertEqual(compact_ingredient_amounts(cursor), 1)
+
+    def test_groceries_merged(self):
+        course = self.plan()
+        self.assertEqual(GroceryListItem.objects.filter(course=course).count(), 2)
+        self.compact()
+        self.assertEqual(list(GroceryListItem.objects.filter(course=course)
+                                                     .values_list('ingredient_amount_id',
+                                                                  flat=True)),
+                         [self.kept.id])
+        self.assertEqual(list(self.dish.ingredient_amounts.all()), [self.kept])
+
+    def test_bought_groceries_kept(self):
+        course = self.plan()
+        bought = GroceryListItem.objects.get(course=course, ingredient_amount=self.duplicate)
+        bought.purchased = True
+        bought.save()
+        self.compact()
+        self.assertEqual(list(GroceryListItem.objects.filter(course=course)
+                                                     .values_list('id', 'purchased')),
+                         [(bought.id, True)])
+
+
+class MealVersionTest(TestCase):
+    """Every change to a meal moves its version on, so its cached
+    calendar cell is drawn again"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='testers')
+        cls.user = make_member('alice', cls.team)
+        cls.tag = Tag.objects.create(name='weeknight')
+
+    def setUp(self):
+        self.meal = Meal.objects.create(team=self.team, meal_type='dinner', meal_prep='cook',
+                                        date=date.today())
+
+    def version(self):
+        return Meal.objects.get(id=self.meal.id).version
+
+    def test_saved_outside_the_views(self):
+        before = self.version()
+        self.meal.meal_prep = 'buy'
+        self.meal.save()
+        self.assertGreater(self.version(), before)
+
+    def test_stale_copy_doesnt_roll_back(self):
+        stale = Meal.objects.get(id=self.meal.id)
+        self.meal.tags.add(self.tag)
+        bumped = self.version()
+        stale.meal_prep = 'buy'
+        stale.save()
+        self.assertGreater(self.version(), bumped)
+
+    def test_new_meal_with_its_id_given(self):
+        meal = Meal(pk=self.meal.id + 1000, team=self.team, meal_type='lunch',
+                    meal_prep='cook', date=date.today())
+        meal.save()
+        self.assertEqual(Meal.objects.get(id=meal.id).meal_type, 'lunch')
+
+    def test_cleared_from_the_tag(self):
+        self.meal.tags.add(self.tag)
+        before = self.version()
+        self.tag.meal_set.clear()
+        self.assertGreater(self.version(), before)
+
+
+class MealCoursesTest(TestCase):
+    """Taking courses off a meal costs the same however many go, and
+    still marks the meal and its team as changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.team = Team.objects.create(name='testers')
+        cls.user = make_member('alice', cls.team)
+        cls.dishes = [Dish.objects.create(name='dish %d' % i, created_by=cls.user.myuser)
+                      for i in range(5)]
+        for i, dish in enumerate(cls.dishes):
+            dish.ingredient_amounts.add(IngredientAmount.objects.create(
+                ingredient=Ingredient.objects.create(name='ingredient %d' % i), amount='1 cup'))
+
+    def plan(self, day=0):
+        meal = Meal.objects.create(team=self.team, meal_type='dinner', meal_prep='cook',
+                                   date=date.today() + timedelta(days=day))
+        save_meal_courses(meal, self.dishes)
+        return Meal.objects.get(id=meal.id)
+
+    def removal_queries(self, removed):
+        meal = self.plan(day=removed)
+        with CaptureQueriesContext(connection) as queries:
+            save_meal_courses(meal, self.dishes[removed:])
+        return len(queries)
+
+    def test_queries_dont_grow(self):
+        self.assertEqual(self.removal_queries(1), self.removal_queries(4))
+
+    def test_meal_and_team_changed(self):
+        meal = self.plan()
+        modified_at = Team.objects.get(id=self.team.id).modified_at
+        save_meal_courses(meal, self.dishes[:1])
+        self.assertGreater(Meal.objects.get(id=meal.id).version, meal.version)
+        self.assertGreater(Team.objects.get(id=self.team.id).modified_at, modified_at)
+        self.assertEqual(list(meal.course_set.values_list('dish_id', flat=True)),
+                         [self.dishes[0].id])
+        self.assertEqual(GroceryListItem.objects.filter(course__meal=meal).count(), 1)
+
+
+class ConditionalGetTest(TransactionTestCase):
+    """Pages built from the catalog are only answered with a 304 when the
+    catalog's version is kept in a cache every process shares
+
+    Versions are bumped once a write commits, so the writes here have to."""
+
+    def setUp(self):
+        cache.clear()
+        self.team = Team.objects.create(name='testers')
+        self.client.force_login(make_member('alice', self.team))
+
+    def get_twice(self, url):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        if not first.has_header('ETag'):
+            return None
+        return self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_shared_cache(self):
+        cache.clear()
+        self.assertEqual(self.get_twice(reverse('grocery-list')), 304)
+        self.assertEqual(self.get_twice(reverse('model-json', args=['dish'])), 304)
+        # A change to the catalog is seen by the next request
+        first = self.client.get(reverse('grocery-list'))
+        Tag.objects.create(name='new')
+        self.assertEqual(self.client.get(reverse('grocery-list'),
+                                         HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_cache_per_process(self):
+        self.assertIsNone(self.get_twice(reverse('grocery-list')))
+        self.assertIsNone(self.get_twice(reverse('model-json', args=['dish'])))
+        # Rows that only change with the team still get one
+        self.assertEqual(self.get_twice(reverse('model-json', args=['meal'])), 304)
+
+    def test_grocery_ingredient_changed(self):
+        dish = Dish.objects.create(name='stew', created_by=self.team.myuser_set.get())
+        amount = IngredientAmount.objects.create(
+            ingredient=Ingredient.objects.create(name='flour'), amount='1 cup')
+        dish.ingredient_amounts.add(amount)
+        meal = Meal.objects.create(team=self.team, meal_type='dinner', date=date.today())
+        Course.objects.create(meal=meal, dish=dish)
+        url = reverse('model-json', args=['grocerylistitem'])
+        first = self.client.get(url)
+        amount.ingredient = Ingredient.objects.create(name='rice flour')
+        amount.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+
+class HotQueryPlansTest(TestCase):
+    """Each query behind the calendar, grocery list and team pages can be
+    answered from an index rather than reading its tables in full"""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate('explain', teams=3, users_per_team=1, years=1, dishes=60, ingredients=30,
+                 tags=5, favorites=20, random_groceries=5, seed=1)
+        cls.team = Team.objects.filter(name__startswith='explain').order_by('id').first()
+
+    def test_no_sequential_scans(self):
+        with connection.cursor() as cursor:
+            # The seeded tables are small enough that Postgres would rather
+            # read them whole, so this only asks whether an index could be used
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in hot_queries(self.team):
+                scans = explain_scans(cursor, queryset)
+                self.assertTrue(scans, name)
+                self.assertEqual([table for node, table in scans if node not in INDEX_SCANS],
+                                 [], name)
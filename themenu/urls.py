@@ -21,6 +21,8 @@ from themenu import views
 urlpatterns = [
     url(r'^$', views.index, name='index'),
     url(r'^calendar/(?P<view_date>[\-\d]+)/?$', views.calendar, name='calendar'),
+    url(r'^calendar/(?P<start_date>\d{8})/(?P<end_date>\d{8})/?$', views.calendar_range, name='calendar-range'),
+    url(r'^calendar/(?P<start_date>\d{8})/(?P<end_date>\d{8})/json/?$', views.calendar_json, name='calendar-json'),
     url(r'^courseupdate/?$', views.course_update, name='course-update'),
     url(r'^groceryupdate/?$', views.grocery_update, name='grocery-update'),
     url(r'^grocery_list/$', views.grocery_list, name='grocery-list'),
@@ -68,6 +70,7 @@ urlpatterns = [
     url(r'^ingredients/(?P<pk>[\d]+)/update/?$', views.IngredientUpdate.as_view(), name='ingredient-update'),
     url(r'^ingredients/(?P<pk>[\d]+)/delete/?$', views.IngredientDelete.as_view(), name='ingredient-delete'),
     url(r'^ingredients/(?P<pk>[\d]+)/?$', views.IngredientDetail.as_view(), name='ingredient-detail'),
+    url(r'^ingredients/cookwith/?$', views.cook_with, name='cook-with'),
 
     url(r'^randomgrocery/create/?$', views.RandomGroceryItemCreate.as_view(), name='random-grocery-create'),
 
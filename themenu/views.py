@@ -1,13 +1,15 @@
 import json
-from collections import defaultdict, OrderedDict
+from collections import defaultdict
 from itertools import chain
 from datetime import timedelta, date, datetime
 
 from django.apps import apps
 from django.shortcuts import render, get_object_or_404
-from django.http import JsonResponse, HttpResponseRedirect, Http404
+from django.http import JsonResponse, HttpResponseRedirect, Http404, StreamingHttpResponse
 from django.core.urlresolvers import reverse, reverse_lazy
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 from django.views.generic.edit import CreateView, ModelFormMixin
 from django.views.generic.detail import DetailView
@@ -15,11 +17,13 @@ from django.views.generic.list import ListView
 from django.views.generic.edit import UpdateView, DeleteView
 
 
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from django.shortcuts import redirect
 from django.contrib import messages
 
-from django.db.models import Count, Avg
+from django.db import router, transaction
+from django.db.models import Count
+from django.db.models.deletion import Collector
 
 # from registration.views import RegistrationView
 
@@ -29,9 +33,43 @@ from themenu.models import (
     Course, GroceryListItem,
     RandomGroceryItem, DishReview
 )
+from themenu.groceries import (
+    grocery_details,
+    grocery_groups,
+    set_groceries_purchased,
+    sync_course_groceries,
+)
+from themenu.caching import (
+    CACHE_TIMEOUT, CATALOG, bump_version, cache_is_shared, cached, scope_versions, team_scope,
+)
+from themenu.conditional import (
+    api_etag,
+    api_last_modified,
+    team_page_etag,
+    team_page_last_modified,
+    touch_team,
+)
+from themenu.api import api_queryset, cursor_field, iter_api_rows, parse_limit
+from themenu.search import search_dishes
+from themenu.ingredients import dish_page, set_dish_ingredients
+from themenu.stats import (
+    dish_leaderboard,
+    load_meal_states,
+    planning_coverage,
+    record_meal_changes,
+)
+from themenu.plans import (
+    MAX_RANGE_WEEKS,
+    bump_meal_versions,
+    load_range_plan,
+    range_plan_as_dicts,
+    set_course_flags,
+    week_range,
+)
 
 from themenu.forms import (
     # DishModelForm,
+    CookWithForm,
     DishForm,
     MealModelForm,
     TagModelForm,
@@ -44,28 +82,29 @@ def index(request):
     return redirect('calendar', view_date=datetime.strftime(date.today(), '%Y%m%d'))
 
 
-def scores(request):
-    fast_dishes = Dish.objects.annotate(avg_speed=Avg('dishreview__fastness'))\
-        .filter(avg_speed__gte=2.5).order_by('-avg_speed')
-    tasty_dishes = Dish.objects.annotate(avg_results=Avg('dishreview__results'))\
-        .filter(avg_results__gte=2.5).order_by('-avg_results')
-    easy_dishes = Dish.objects.annotate(avg_ease=Avg('dishreview__ease'))\
-        .filter(avg_ease__gte=2.5).order_by('-avg_ease')
-
-    hall_of_fame = []
-    for dish in fast_dishes:
-        if dish in tasty_dishes and dish in easy_dishes:
-            hall_of_fame.append(dish)
+# The average score (out of 3) a dish needs to make the scores page
+GOOD_SCORE = 2.5
 
-    context = {
-        'fast_dishes': fast_dishes,
-        'tasty_dishes': tasty_dishes,
-        'easy_dishes': easy_dishes,
-        'perfect_dishes': hall_of_fame,
-    }
+
+def scores(request):
+    def load_scores():
+        dishes = Dish.objects.only('id', 'name')
+        fast_dishes = dishes.filter(avg_fastness__gte=GOOD_SCORE).order_by('-avg_fastness', 'name')
+        tasty_dishes = dishes.filter(avg_results__gte=GOOD_SCORE).order_by('-avg_results', 'name')
+        easy_dishes = dishes.filter(avg_ease__gte=GOOD_SCORE).order_by('-avg_ease', 'name')
+        hall_of_fame = fast_dishes.filter(avg_results__gte=GOOD_SCORE, avg_ease__gte=GOOD_SCORE)
+        return {
+            'fast_dishes': list(fast_dishes),
+            'tasty_dishes': list(tasty_dishes),
+            'easy_dishes': list(easy_dishes),
+            'perfect_dishes': list(hall_of_fame),
+        }
+
+    context = cached('scores', [CATALOG], load_scores)
     return render(request, 'themenu/scores.html', context)
 
 
+@condition(etag_func=team_page_etag, last_modified_func=team_page_last_modified)
 def grocery_list(request):
     """Logic for populating the grocery list
 
@@ -73,13 +112,6 @@ def grocery_list(request):
     that uses the same ingredient.
     This is so that on the shopping list, you can see which meals you are
     getting an item for"""
-    def _get_meal_groceries(team):
-        """Fetches the future meals for a team, unpurchased first"""
-        return GroceryListItem.objects.filter(course__meal__team=team)\
-                                      .filter(course__meal__date__gte=date.today())\
-                                      .order_by('purchased',
-                                                'ingredient_amount__ingredient__name')
-
     def _get_random_groceries(team):
         """Returns a queryset with all unpurchased RandomGroceryItems"""
         return RandomGroceryItem.objects.filter(team=team)\
@@ -93,40 +125,27 @@ def grocery_list(request):
         # if you don't have a team, you can't plan meals
         # so why would you need a grocery list
 
-    grocery_list = _get_meal_groceries(team)
-
-    # Using defaultdict to group same named ingredients together
-    ingredient_grocery_list = defaultdict(lambda: ([], []))
-
-    # This variables will end up as a list with 5-tuples:
+    # The database groups the future groceries by ingredient, and a second
+    # query fetches each item with its meal and dish for the dropdowns.
+    # This variable will end up as a list with 5-tuples:
     # (u'frozen berries',  <- The name of the ingredient
+    #  '1/4 cup, 1 bowl'  <- a string of the amounts of the ingredients
     #   [<GroceryListItem: IngredientAmount: 28, frozen berries, Purchased: False>,
     #    <GroceryListItem: IngredientAmount: 28, frozen berries, Purchased: False>],
-    #  '1/4 cup, 1 bowl'  <- a string of the amounts of the ingredients
     #  False,      <- True/False if they have all been purchased already
     #  '245,267')  <- ids of the GroceryListItems as a string list for html data
     # The whole GroceryListItem model is included so the template can get the
     # dish name, meal type, number of meals, and meal date
-
-    for grocery_item in grocery_list:
-        key = grocery_item.ingredient_amount.ingredient.name
-        amount = grocery_item.ingredient_amount.amount
-        ingredient_grocery_list[key][0].append(grocery_item)
-        ingredient_grocery_list[key][1].append(amount)
-    # Add the fourth and fifth items to the tuples:
-    # a bool if all groceries have been purchased, and
-    # a comma separated string of grocery ids (to update all at once)
-    mark_all_purchased = [
-        (ingredient_name,                                  # name (string)
-         ', '.join(a if a else 'N/A' for a in amount_list),  # ids_string
-         grocery_items,                               # list of models
-         all(g.purchased for g in grocery_items),     # purchased bool
-         ','.join(str(g.id) for g in grocery_items))  # ids_string
-        for ingredient_name, (grocery_items, amount_list) in ingredient_grocery_list.items()
+    today = date.today()
+    details = grocery_details(team, today)
+    sorted_items = [
+        (group['ingredient_name'],
+         group['amounts'],
+         details[group['ingredient_name']],
+         group['all_purchased'],
+         ','.join(str(i) for i in group['ids']))
+        for group in grocery_groups(team, today)
     ]
-    # Sort the tuples with ones that haven't been purchased first
-    # note: the 4th item in each tuple is the "purchased" boolean
-    sorted_items = sorted(mark_all_purchased, key=lambda x: x[3])
 
     random_grocery_list = _get_random_groceries(team)
     context = {
@@ -136,8 +155,33 @@ def grocery_list(request):
     return render(request, 'themenu/grocery_list.html', context)
 
 
+def render_calendar(request, team, start, end, window_url):
+    """Used by both calendar and calendar_range
+
+    window_url(monday) gives the url of a window the same size
+    as this one, starting on another monday"""
+    span = end - start + timedelta(days=1)
+
+    context = {}
+    context['weeks'] = load_range_plan(team, start, end)
+    context['meal_choices'] = Meal.MEAL_TYPE_CHOICES
+    context['thisweekmonday'] = start.strftime('%d %B %Y')
+    context['lastsunday'] = end.strftime('%d %B %Y')
+    context['previous_url'] = window_url(start - span)
+    context['next_url'] = window_url(start + span)
+    context['today'] = date.today()
+    # Filled cells are cached by meal version; dish and tag names come
+    # from the catalog, so a change there redraws them too
+    context['catalog_version'] = scope_versions([CATALOG])[0]
+    # A timeout of 0 caches nothing, for when the cache isn't shared
+    context['cell_cache_timeout'] = CACHE_TIMEOUT if cache_is_shared() else 0
+
+    return render(request, 'themenu/calendar.html', context)
+
+
+@condition(etag_func=team_page_etag, last_modified_func=team_page_last_modified)
 def calendar(request, view_date):
-    parsed_date = datetime.strptime(str(view_date), '%Y%m%d')
+    parsed_date = datetime.strptime(str(view_date), '%Y%m%d').date()
     team = request.user.myuser.team
 
     if not team:
@@ -145,102 +189,172 @@ def calendar(request, view_date):
         # redirect to a team register page
         # if you don't have a team, you can't plan meals
 
-    def weekdays():
-        weekdays_list = [parsed_date + timedelta(days=i)
-                         for i in range(0 - parsed_date.weekday(), 7 - parsed_date.weekday())]
-        return weekdays_list
+    # ?weeks=4 shows four weeks starting with this one
+    try:
+        weeks = int(request.GET.get('weeks', 1))
+    except ValueError:
+        weeks = 1
+    weeks = max(1, min(weeks, MAX_RANGE_WEEKS))
+    start, end = week_range(parsed_date, parsed_date + timedelta(weeks=weeks - 1))
 
-    def get_meal_by_type_and_date(mealtype, date):
-        try:
-            thismeal = Meal.objects.get(date=date, meal_type=mealtype, team=team)
-            return thismeal
-        except Meal.DoesNotExist:
-            return None
+    def window_url(monday):
+        url = reverse('calendar', kwargs={'view_date': monday.strftime('%Y%m%d')})
+        return url + '?weeks=%d' % weeks if weeks > 1 else url
 
-    def weekplan(weekdays_list):
-        weekplan = OrderedDict()
-        meal_types = [i[1] for i in Meal.MEAL_TYPE_CHOICES]
-        for type_ in meal_types:
-            days = []
-            for day in weekdays_list:
-                days.append({'date': day,
-                             'daymeal': get_meal_by_type_and_date(type_, day)})
-            weekplan[type_] = days
-        return weekplan
-
-    def monday(valence):
-        monday = parsed_date + timedelta(days=(7 * valence - parsed_date.weekday()))
-        # prettymonday = monday.strftime('%d %B, %Y')
-        return monday
+    return render_calendar(request, team, start, end, window_url)
 
-    context = {}
-    context['weekplan'] = weekplan(weekdays())
-    context['meal_choices'] = Meal.MEAL_TYPE_CHOICES
-    context['thisweekmonday'] = monday(0).strftime('%d %B %Y')
-    context['lastmondaydate'] = monday(-1).strftime('%Y%m%d')
-    context['lastweekmonday'] = monday(-1).strftime('%d %B %Y')
-    context['nextmondaydate'] = monday(1).strftime('%Y%m%d')
-    context['nextweekmonday'] = monday(1).strftime('%d %B %Y')
-    context['today'] = date.today()
 
-    return render(request, 'themenu/calendar.html', context)
+def parse_date_range(start_date, end_date):
+    """Turn the url's start and end dates into whole weeks"""
+    try:
+        start = datetime.strptime(str(start_date), '%Y%m%d').date()
+        end = datetime.strptime(str(end_date), '%Y%m%d').date()
+    except ValueError:
+        raise Http404('Dates must look like 20170131')
+    if end < start:
+        raise Http404('The end date is before the start date')
+    return week_range(start, end)
+
+
+def range_url(url_name, start, end):
+    return reverse(url_name, kwargs={'start_date': start.strftime('%Y%m%d'),
+                                     'end_date': end.strftime('%Y%m%d')})
+
+
+@condition(etag_func=team_page_etag, last_modified_func=team_page_last_modified)
+def calendar_range(request, start_date, end_date):
+    start, end = parse_date_range(start_date, end_date)
+    team = request.user.myuser.team
+
+    if not team:
+        return HttpResponseRedirect(reverse('team-list'))
+
+    span = end - start
+
+    def window_url(monday):
+        return range_url('calendar-range', monday, monday + span)
+
+    return render_calendar(request, team, start, end, window_url)
+
+
+@condition(etag_func=team_page_etag, last_modified_func=team_page_last_modified)
+def calendar_json(request, start_date, end_date):
+    """The meals in a date range, for scrolling through the calendar
+
+    previous and next point at the windows on either side so they can be
+    fetched ahead of time"""
+    start, end = parse_date_range(start_date, end_date)
+    team = request.user.myuser.team
+
+    if not team:
+        return JsonResponse({"OK": False, "error": "No team"}, status=400)
+
+    span = end - start
+    shift = span + timedelta(days=1)
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': range_plan_as_dicts(team, start, end),
+        'previous': range_url('calendar-json', start - shift, end - shift),
+        'next': range_url('calendar-json', start + shift, end + shift),
+    })
 
 
 @require_http_methods(["POST"])
 def course_update(request):
+    """Check a course as prepared or eaten
+
+    Takes a single change, like
+        {"mealId": 12, "dishId": 3, "attribute": "eaten", "checked": true}
+    or a list of them under "updates"."""
     posted_data = json.loads(request.body)
-    meal = get_object_or_404(Meal, id=posted_data['mealId'])
-    dish = get_object_or_404(Dish, id=posted_data['dishId'])
-    course = Course.objects.get(meal=meal, dish=dish)
-    attribute = posted_data['attribute']
-    value = posted_data['checked']
-    if attribute == 'eaten':
-        course.eaten = value
-        course.save(update_fields=['eaten'])
-    elif attribute == 'prepared':
-        course.prepared = value
-        course.save(update_fields=['prepared'])
+    try:
+        updates = [(int(update['mealId']), int(update['dishId']),
+                    update['attribute'], bool(update['checked']))
+                   for update in posted_data.get('updates', [posted_data])]
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"OK": False}, status=400)
+    if any(attribute not in ('eaten', 'prepared') for _, _, attribute, _ in updates):
+        return JsonResponse({"OK": False}, status=400)
 
-    return JsonResponse({"OK": True})
+    team = request.user.myuser.team
+    if not team:
+        return JsonResponse({"OK": False, "error": "No team"}, status=400)
+    changed = set_course_flags(team, updates)
+    return JsonResponse({"OK": True, "courses": changed})
 
 
 @require_http_methods(["POST"])
 def grocery_update(request):
+    """Check groceries on or off
+
+    Takes a single change, like
+        {"groceryId": "245,267", "groceryType": "meal", "checked": true}
+    or a list of them under "updates", for meal and random groceries alike.
+    Replies with how many of each kind were changed."""
 
-    def save_grocery(grocery, checked_value):
-        grocery.purchased = checked_value
-        grocery.save(update_fields=['purchased'])
+    def parse_ids(grocery_id):
+        if isinstance(grocery_id, list):
+            return [int(item) for item in grocery_id]
+        return [int(item) for item in str(grocery_id).split(',')]
 
     posted_data = json.loads(request.body)
-    id_list = [int(item) for item in str(posted_data['groceryId']).split(',')]
-    checked_value = posted_data['checked']
-    if posted_data['groceryType'] == 'meal':
-        print(posted_data)
+    try:
+        updates = [(update['groceryType'], parse_ids(update['groceryId']), bool(update['checked']))
+                   for update in posted_data.get('updates', [posted_data])]
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"OK": False}, status=400)
+    if any(grocery_type not in ('meal', 'random') for grocery_type, _, _ in updates):
+        return JsonResponse({"OK": False}, status=400)
+
+    team = request.user.myuser.team
+    if not team:
+        return JsonResponse({"OK": False, "error": "No team"}, status=400)
+    counts = set_groceries_purchased(team, updates)
+    return JsonResponse({"OK": True, "meal": counts['meal'], "random": counts['random']})
 
-        grocery_list = GroceryListItem.objects.filter(id__in=id_list)
-        # Now save each one individually
-        for grocery in grocery_list:
-            save_grocery(grocery, checked_value)
-    elif posted_data['groceryType'] == 'random':
-        print(posted_data)
-        grocery = get_object_or_404(RandomGroceryItem, id=posted_data['groceryId'])
-        save_grocery(grocery, checked_value)
-    else:
-        JsonResponse({"OK": False})
 
-    return JsonResponse({"OK": True})
+DISH_SEARCH_PAGE_SIZE = 50
 
 
 def dish_search(request):
     search_term = request.GET.get('text', '')
-    matching_dishes = Dish.objects.filter(name__icontains=search_term)
+    # The results only show names, so leave the recipes in the database
+    matching_dishes = search_dishes(search_term).only('id', 'name')
+    paginator = Paginator(matching_dishes, DISH_SEARCH_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get('page', 1))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
     context = {
         'search_term': search_term,
-        'matching_dishes': matching_dishes,
+        'matching_dishes': page,
     }
     return render(request, 'themenu/dish_search.html', context)
 
 
+def cook_with(request):
+    """The dishes that use all of the ingredients picked"""
+    form = CookWithForm(request.GET or None)
+    ingredients = []
+    dishes = None
+    if form.is_valid():
+        ingredients = form.cleaned_data['ingredients']
+        dishes = dish_page([i.id for i in ingredients], request.GET.get('page', 1))
+    # For the pager, which adds its own page number
+    params = request.GET.copy()
+    params.pop('page', None)
+    context = {
+        'form': form,
+        'ingredients': ingredients,
+        'dishes': dishes,
+        'query': params.urlencode(),
+    }
+    return render(request, 'themenu/cook_with.html', context)
+
+
 class RandomGroceryItemCreate(CreateView):
     model = RandomGroceryItem
     fields = ['name']
@@ -275,12 +389,24 @@ class RandomGroceryItemCreate(CreateView):
 class DishDetail(DetailView):
     model = Dish
 
+    def get_object(self, queryset=None):
+        """The dish with its creator, tags and ingredients, from the cache
+        unless the catalog has changed"""
+        pk = self.kwargs['pk']
+
+        def load_dish():
+            dishes = Dish.objects.select_related('created_by__user')\
+                                 .prefetch_related('tags', 'ingredient_amounts__ingredient')
+            return get_object_or_404(dishes, pk=pk)
+        return cached('dish-detail:%s' % pk, [CATALOG], load_dish)
+
     def get_context_data(self, **kwargs):
         context = super(DishDetail, self).get_context_data(**kwargs)
         this_dish = self.object
         try:
             context['user_review'] = this_dish.dishreview_set.filter(myuser=self.request.user.myuser).first()
-            context['other_reviews'] = this_dish.dishreview_set.exclude(myuser=self.request.user.myuser)
+            context['other_reviews'] = this_dish.dishreview_set.exclude(myuser=self.request.user.myuser)\
+                                                               .select_related('myuser__user')
         except AttributeError:  # Anonymous user
             pass
         return context
@@ -297,24 +423,16 @@ def save_dish(form, request):
     ias = zip(chain.from_iterable(form.data.getlist(key) for key in ingredient_keys),
               chain.from_iterable(form.data.getlist(key) for key in amount_keys))
 
-    used_ing_amts = []
-    for ia in ias:
-        if not ia[0]:  # no ingredient, skip, don't care about amounts
-            continue
-        ingredient = Ingredient.objects.get(pk=int(ia[0]))
-        new_ia, created = IngredientAmount.objects.get_or_create(ingredient=ingredient,
-                                                                 amount=ia[1])
-        used_ing_amts.append(new_ia)
+    pairs = [(int(ingredient_id), amount) for ingredient_id, amount in ias
+             if ingredient_id]  # no ingredient, skip, don't care about amounts
 
     myuser = get_object_or_404(MyUser, user=request.user)
     new_dish.created_by = myuser
-    new_dish.save()
-
-    # only keep the ones that survived on this form submit (for updates)
-    new_dish.ingredient_amounts.clear()
-    for ia in used_ing_amts:
-        new_dish.ingredient_amounts.add(ia)
-    form.save_m2m()  # Save the list of tags, another M2M
+    with transaction.atomic():
+        new_dish.save()
+        # only keep the ones that survived on this form submit (for updates)
+        set_dish_ingredients(new_dish, pairs)
+        form.save_m2m()  # Save the list of tags, another M2M
 
     return new_dish
 
@@ -335,7 +453,7 @@ class DishUpdate(UpdateView):
         dish_object = kws['instance']
 
         # Gather the data of ingredients/amounts to populate the edit form
-        ing_amt_list = dish_object.ingredient_amounts.all()
+        ing_amt_list = dish_object.ingredient_amounts.select_related('ingredient')
         initial_data = self.get_initial()
         for idx, ing_amt in enumerate(ing_amt_list):
             key_ing = 'ingredient{}'.format(idx + 1)
@@ -424,15 +542,55 @@ class TeamCreate(CreateView):
 class TeamDetail(DetailView):
     model = Team
 
+    # (days, label) for the windows the dish leaderboards can cover
+    LEADERBOARD_WINDOWS = [(None, 'All time'), (30, 'Last 30 days'),
+                           (90, 'Last 90 days'), (365, 'Last year')]
+
+    # How many of the latest weeks the plan rate chart shows
+    COVERAGE_CHART_WEEKS = 12
+
+    def get_days(self):
+        """The ?days= window for the leaderboards, or None for all time
+
+        Only the offered windows are taken, so a huge value can't overflow
+        the start date or fill the cache with a key per value."""
+        try:
+            days = int(self.request.GET.get('days', ''))
+        except ValueError:
+            return None
+        return days if days in dict(self.LEADERBOARD_WINDOWS) else None
+
     def get_context_data(self, **kwargs):
         this_team = self.object
         context = super(TeamDetail, self).get_context_data(**kwargs)
-        team_members = MyUser.objects.filter(team=this_team)
+        team_members = MyUser.objects.filter(team=this_team).select_related('user')
         context['member_count'] = team_members.count()
         context['team_members'] = team_members
         context['team'] = this_team
+        days = self.get_days()
+        context['days'] = days
+        context['leaderboard_windows'] = self.LEADERBOARD_WINDOWS
+        # The windows end today, so the cached stats can only last the day
+        context.update(cached('team-detail:%s:%s:%s' % (this_team.id, days, date.today()),
+                              [team_scope(this_team.id), CATALOG],
+                              lambda: self.get_team_stats(this_team, days)))
         return context
 
+    def get_team_stats(self, team, days):
+        """Everything on the page worked out from the team's meals"""
+        start = date.today() - timedelta(days=days - 1) if days else None
+        coverage = planning_coverage(team, start)
+        return {
+            'planned_dishes': dish_leaderboard(team, 'planned', days),
+            'cooked_dishes': dish_leaderboard(team, 'cooked', days),
+            'eaten_dishes': dish_leaderboard(team, 'eaten', days),
+            'common_ingredients': list(team.common_ingredients()),
+            'prep_rate': team.prep_rate(),
+            'eat_rate': team.eat_rate(),
+            'coverage': coverage,
+            'coverage_weeks': coverage['weeks'][-self.COVERAGE_CHART_WEEKS:],
+        }
+
 
 class TeamList(ListView):
     model = Team
@@ -472,28 +630,62 @@ class MealDelete(DeleteView):
     model = Meal
     success_url = reverse_lazy('index')
 
+    def delete(self, request, *args, **kwargs):
+        meal = self.get_object()
+        with transaction.atomic():
+            before = load_meal_states([meal.id])
+            response = super(MealDelete, self).delete(request, *args, **kwargs)
+            record_meal_changes(before, {})
+        return response
+
+
+def save_meal_courses(meal, dishes):
+    """Make the meal's courses match the chosen dishes
+
+    Courses for dishes that stay on the meal are left alone, so they keep
+    their prepared/eaten state and their groceries. New courses are
+    inserted in bulk, which skips the Course post_save signal, so the
+    groceries of the whole meal are brought up to date here in one pass.
+    Removed courses are deleted together, without the per-course version
+    bump and team touch, which are done once for the meal instead."""
+    courses = {course.dish_id: course for course in meal.course_set.all()}
+    dish_ids = set(dish.id for dish in dishes)
+
+    removed_courses = [course for dish_id, course in courses.items()
+                       if dish_id not in dish_ids]
+    if removed_courses:
+        for course in removed_courses:
+            course._changed_with_meal = True
+        collector = Collector(using=router.db_for_write(Course))
+        collector.collect(removed_courses)
+        collector.delete()
+
+    kept_courses = [course for dish_id, course in courses.items()
+                    if dish_id in dish_ids]
+    new_courses = Course.objects.bulk_create(
+        [Course(meal=meal, dish_id=dish_id) for dish_id in dish_ids - set(courses)])
+    sync_course_groceries(kept_courses + new_courses)
+    if removed_courses or new_courses:
+        bump_meal_versions([meal.id])
+        bump_version(team_scope(meal.team_id))
+        touch_team(meal.team_id)
+
 
 class MealSaveMixin(ModelFormMixin):
     """Must do special work to add many-to-many models,
     especially with the intermediate model Course"""
     def form_valid(self, form):
-        self.object = form.save(commit=False)
-        self.object.save()
-
-        # Only remove tags and tags no longer specified by the form
-        removed_tags = self.object.tags.exclude(id__in=form.cleaned_data['tags'])
-        for t in removed_tags:
-            self.object.tags.remove(t)
-
-        # Intermediate model means you must clear all courses
-        # https://docs.djangoproject.com/en/1.10/topics/db/models/#intermediary-manytomany
-        self.object.dishes.clear()
-
-        for dish in form.cleaned_data['dishes']:
-            course = Course(meal=self.object, dish=dish)
-            course.save()
-        for tag in form.cleaned_data['tags'].exclude(id__in=self.object.tags.all()):
-            self.object.tags.add(tag)
+        with transaction.atomic():
+            # The form has already changed the instance, so the team stats
+            # need what's in the database from before the save
+            before = load_meal_states([form.instance.pk])
+            self.object = form.save(commit=False)
+            self.object.save()
+            self.object.tags.set(form.cleaned_data['tags'])
+            save_meal_courses(self.object, form.cleaned_data['dishes'])
+            record_meal_changes(before, load_meal_states([self.object.pk]))
+            # Saving the meal bumped its version (see signals.py), and the
+            # courses written in bulk after it are in the same transaction
         return super(ModelFormMixin, self).form_valid(form)
 
 
@@ -528,10 +720,7 @@ class MealCreate(MealSaveMixin, CreateView):
         return initial
 
     def form_valid(self, form):
-        obj = form.save(commit=False)
-        team = get_object_or_404(Team, myuser=self.request.user.myuser)
-        obj.team = team
-        obj.save()
+        form.instance.team = get_object_or_404(Team, myuser=self.request.user.myuser)
         return super(MealCreate, self).form_valid(form)
 
 
@@ -545,15 +734,15 @@ class TagDetail(DetailView):
     def get_context_data(self, **kwargs):
         this_tag = self.object
         tag_dishes = this_tag.dish_set
-        tag_ing = this_tag.ingredient_set
         tag_meals = this_tag.meal_set
         context = super(TagDetail, self).get_context_data(**kwargs)
-        context['dish_count'] = tag_dishes.count()
+        # The counts are kept on the tag (see themenu.counts)
+        context['dish_count'] = this_tag.dish_count
         context['dishes'] = tag_dishes.annotate(num_meals=Count('meal')).order_by('-num_meals')[:15]
-        context['ingredient_count'] = tag_ing.count()
+        context['ingredient_count'] = this_tag.ingredient_count
         # TODO: https://github.com/goobers/themenu/issues/90
-        # context['ingredients'] = tag_ing.annotate(num_dishes=Count('dish')).order_by('-num_dishes')[:15]
-        context['meal_count'] = tag_meals.count()
+        # context['ingredients'] = this_tag.ingredient_set.annotate(num_dishes=Count('dish')).order_by('-num_dishes')[:15]
+        context['meal_count'] = this_tag.meal_count
         context['meals'] = tag_meals.order_by('-date')[:15]
         # If we need to add extra items to what passes to the template
         # context['now'] = timezone.now()
@@ -565,9 +754,8 @@ class TagList(ListView):
 
     def get_context_data(self, **kwargs):
         context = super(TagList, self).get_context_data(**kwargs)
-        context['tags'] = Tag.objects.all().annotate(num_dishes=Count('dish', distinct=True),
-                                             num_ingredients=Count('ingredient', distinct=True)
-                                            ).order_by('-num_dishes')
+        context['tags'] = cached('tag-list', [CATALOG], lambda: list(
+            Tag.objects.order_by('-dish_count', 'name')))
         # If we need to add extra items to what passes to the template
         # context['now'] = timezone.now()
         return context
@@ -616,7 +804,7 @@ class IngredientDetail(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super(IngredientDetail, self).get_context_data(**kwargs)
-        context['dish_set'] = Dish.objects.filter(ingredient_amounts__ingredient=self.object)
+        context['dishes'] = dish_page([self.object.id], self.request.GET.get('page', 1))
         return context
 
 
@@ -625,12 +813,29 @@ class IngredientDelete(DeleteView):
     success_url = reverse_lazy('index')
 
 
+# Ways the ingredient list can be sorted -> ordering
+INGREDIENT_SORTS = {
+    'usage': ('-dish_count', 'name'),
+    'name': ('name',),
+}
+
+
 class IngredientList(ListView):
     model = Ingredient
+    paginate_by = 60
+
+    def get_sort(self):
+        sort = self.request.GET.get('sort')
+        return sort if sort in INGREDIENT_SORTS else 'usage'
+
+    def get_queryset(self):
+        # dish_count is kept on each ingredient (see themenu.counts)
+        return Ingredient.objects.only('id', 'name', 'dish_count')\
+                                 .order_by(*INGREDIENT_SORTS[self.get_sort()])
 
     def get_context_data(self, **kwargs):
         context = super(IngredientList, self).get_context_data(**kwargs)
-        context['ingredient_amounts'] = IngredientAmount.objects.all().annotate(num_dishes=Count('dish', distinct=True)).order_by('-num_dishes')
+        context['sort'] = self.get_sort()
         # Form is to search for ingredient details
         context['form'] = IngredientSearchForm
         return context
@@ -686,16 +891,61 @@ def get_fields(model):
 #  <django.db.models.fields.TextField: color>)
 
 
+@condition(etag_func=api_etag, last_modified_func=api_last_modified)
 def model_json(request, model_name):
-    model = apps.get_model('themenu', model_name.title())
-    order_by = request.GET.get('order_by')
-
-    # model_fields = list(model._meta.get_fields())
-    model_fields = get_fields(model)
-    base_query_set = model.objects.values(*[str(f) for f in model_fields])
-
-    if order_by:
-        base_query_set = base_query_set.order_by(order_by)
-
-    tag_query_set = list(base_query_set)
-    return JsonResponse(tag_query_set, safe=False)
+    """Any model's rows as a json list, a page at a time
+
+    Takes `fields` (comma separated), `order_by`, `limit` and `after`, the
+    id of the last row of the previous page. When there may be more rows,
+    the url of the next page is in the Link header. With `stream=1` every
+    row from `after` on (or up to `limit`, if given) is written out as it
+    is read from the database instead of being built up in memory.
+    Rows of models whose changes are tracked (see themenu.conditional)
+    come with an ETag and Last-Modified, and a 304 if they haven't changed."""
+    try:
+        model = apps.get_model('themenu', model_name.title())
+    except LookupError:
+        raise Http404('No model named %s' % model_name)
+    team = request.user.myuser.team if request.user.is_authenticated() else None
+    stream = request.GET.get('stream') == '1'
+
+    try:
+        rows, fields = api_queryset(model, team,
+                                    fields=request.GET.get('fields'),
+                                    order_by=request.GET.get('order_by'),
+                                    after=request.GET.get('after'))
+        limit = parse_limit(request.GET.get('limit'))
+    except ValueError as e:
+        return JsonResponse({"OK": False, "error": str(e)}, status=400)
+
+    if stream:
+        rows = iter_api_rows(model, team,
+                             fields=request.GET.get('fields'),
+                             order_by=request.GET.get('order_by'),
+                             after=request.GET.get('after'),
+                             limit=limit if request.GET.get('limit') else None)
+        return StreamingHttpResponse(stream_json_rows(rows, fields),
+                                     content_type='application/json')
+
+    page = list(rows[:limit])
+    response = JsonResponse([row_fields(row, fields) for row in page], safe=False)
+    if len(page) == limit:
+        params = request.GET.copy()
+        params['after'] = page[-1][cursor_field(model)]
+        response['Link'] = '<%s?%s>; rel="next"' % (
+            request.build_absolute_uri(request.path), params.urlencode())
+    return response
+
+
+def row_fields(row, fields):
+    """Just the fields asked for, without the id if it wasn't"""
+    return {field: row[field] for field in fields}
+
+
+def stream_json_rows(rows, fields):
+    """Write out a json list one row at a time"""
+    encoder = DjangoJSONEncoder()
+    yield '['
+    for i, row in enumerate(rows):
+        yield (',' if i else '') + encoder.encode(row_fields(row, fields))
+    yield ']'